@@ -3,18 +3,29 @@ IPTV 播放列表合并与清理脚本
 """
 import os
 import re
+import shutil
 import logging
+import multiprocessing
+import tempfile
+import threading
+import time
+from collections import ChainMap, deque
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
 
-from tqdm import tqdm
-
-from utils.filter_keywords import Indicators_key, Category_Key, Nsfw_Key
+from utils.filter_keywords import Indicators_key, Category_Key, Nsfw_Key, compile_keyword_matcher
 from config.sources_urls import playlist_urls
-from utils.network import fetch_playlist_content, is_url_accessible
-from utils.m3u_parse import parse_m3u
-from utils.channel_filter import load_channels_txt, get_official_name, get_missing_channels
-from utils.playlist_writer import process_and_normalize_channels, write_merged_playlist
+from utils.network import fetch_playlists_concurrently
+from utils.stream_check import check_urls, BackgroundProber
+from utils.health_store import HealthStore
+from utils.stream_rank import build_stream_scorer
+from utils.url_canonical import canonical_url_key
+from utils.parse_cache import iter_m3u_cached, prune_parse_cache
+from utils.source_cache import prune_source_cache
+from utils.channel_filter import load_channels_txt, get_official_name, get_missing_channels, get_title_cache_stats
+from utils.playlist_writer import (process_and_normalize_channels, normalize_channels, merge_normalized_channels,
+                                   write_merged_playlist)
+from utils.pipeline import SourceWindow, StageMetrics
 
 # 配置日志
 logging.basicConfig(
@@ -25,6 +36,8 @@ logger = logging.getLogger(__name__)
 
 # --- 配置区 ---
 EPG_URL = "https://raw.githubusercontent.com/mingxing0769/iptv/main/out/DrewLive3.xml"
+# 播放列表头部的 url-tvg 是否指向 epg_getcher.py 同时生成的 gzip 版本（EPG_URL + ".gz"），下载量约为原来的 1/20
+EPG_URL_USE_GZIP = False
 OUTPUT_FILE = "out/MergedCleanPlaylist.m3u8"
 
 # 是否根据 channels.txt 进行频道筛选（仅保留 channels.txt 中的频道及其别名）
@@ -34,51 +47,137 @@ CHANNELS_TXT_PATH = "channels.txt"
 # 是否对频道进行筛选，根据 utils.filter_keywords.Category_Key
 CategoryFilter = True
 
+# 并发下载源时的最大线程数，以及同一主机的最大并发数
+MAX_WORKERS_FETCH = 16
+MAX_FETCH_PER_HOST = 8
+
+# 下载阶段的总时限（秒），超时仍未完成的源会被跳过；设为 None 表示不限制
+FETCH_DEADLINE = 300
+
+# 源缓存目录：保存每个源的正文和 ETag / Last-Modified，下次使用条件请求；设为 None 时下载到临时目录，运行结束后删除
+SOURCE_CACHE_DIR = ".cache/sources"
+
+# 解析结果缓存目录：正文未变化的源直接加载上次的解析结果；设为 None 关闭缓存
+PARSE_CACHE_DIR = ".cache/parsed"
+
 # 并发检查 URL 有效性 ---
 URL_CHECK = False
 
-# 并发检查 URL 时的最大线程数，可以根据你的网络和 CPU 情况调整
+# 并发检查 URL 时的最大连接数，可以根据你的网络和 CPU 情况调整
 MAX_WORKERS_URL_CHECK = 100
 
+# 检查 URL 时同一主机的最大并发连接数、全局每秒最大请求数（None 表示不限制）和单个地址的超时（秒）
+URL_CHECK_PER_HOST = 4
+URL_CHECK_RATE = 50
+URL_CHECK_TIMEOUT = 15
+
+# 检查方式："head" 只检查 HTTP 状态；"hls" 下载清单、解析变体并读取一个分片的开头，记录延迟和吞吐量
+URL_CHECK_MODE = "head"
+
+# 流地址健康历史库：只重新检查到期（长期稳定的地址间隔逐步拉长）或从未检查过的地址，
+# 长期失效的地址按指数退避跳过；设为 None 时每次检查全部地址
+HEALTH_DB_PATH = "out/stream_health.sqlite3"
+
+# 每个频道最多保留的流数量：按原始标题的分辨率、健康历史中的延迟和主机成功率、是否 HTTPS 排序后取前 N 个；
+# 设为 None 时保留所有流
+MAX_STREAMS_PER_CHANNEL = 5
+
+# 解析和规范化频道的进程数：按源分片，每个进程解析并过滤一个源，结果按 playlist_urls 的顺序串行合并（去重、统一 TVG 信息、排序），
+# 输出与串行处理逐字节一致。None 表示使用 CPU 核数，1 表示在主进程中串行处理；
+# 未启用流水线且启用 URL_CHECK 时总是串行（需要先得到完整的频道列表再检查）
+PARSE_WORKERS = None
+
+# 流水线模式：下载、解析/规范化、URL 检查和合并同时进行——第一个源下载完成即开始解析，
+# 通过筛选的频道随即开始检查，不再等待上一阶段全部完成。输出与分阶段处理一致
+# （URL_CHECK 时只检查通过筛选的频道）。设为 False 时按阶段依次执行
+PIPELINE = True
+
+# 流水线中同时处于解析中或等待合并的源的最大数量，其余已下载的源留在磁盘上等待（背压，限制内存占用）
+PIPELINE_WINDOW = 8
+
+# URL_CHECK 时，检查阶段最多领先合并阶段的频道条数（即同时等待检查结果的频道上限）
+PIPELINE_PROBE_LOOKAHEAD = 5000
+
+
+# NSFW 关键词只编译一次
+_match_nsfw = compile_keyword_matcher(Nsfw_Key)
+
 
 def is_nsfw(group_title, title):
     """检查频道的 group-title 或 title 是否包含 NSFW 关键词。"""
-    nsfw_keywords = Nsfw_Key
-    text_to_check = f"{group_title} {title}".lower()
-    return any(keyword in text_to_check for keyword in nsfw_keywords)
+    return _match_nsfw(f"{group_title} {title}".lower())
 
 
-def check_urls_concurrently(channels_to_check):
+def _probe_key(url_key, url):
     """
-    使用多线程并发检查频道 URL 的可访问性。
+    探测的分组键：同一个流（canonical_url_key 相同）的 http 和 https 地址各探测一次，
+    这样合并时换用的 https 地址（见 merge_normalized_channels）也是经过检查的。
+    """
+    return url_key, url[:8].lower() == "https://"
+
+
+def check_urls_concurrently(channels_to_check, probe_health=None):
+    """
+    使用 asyncio 连接池并发检查频道 URL 的可访问性。
 
     Args:
         channels_to_check (list): 待检查的频道列表。
+        probe_health (dict): 给定时，本次实际检查过的地址（包括同组的其他写法）记录为 url -> (是否可用, 延迟)，供流排序使用。
 
     Returns:
-        list: 包含所有可访问频道的列表。
-    """
-    logger.info(f"\n🚀 Starting concurrent URL accessibility check for {len(channels_to_check)} channels (up to {MAX_WORKERS_URL_CHECK} workers)...")
-    accessible_channels = []
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS_URL_CHECK) as executor:
-        # 创建 future 到 channel_data 的映射
-        # channel 元组结构：(..., headers, url)
-        # headers 在倒数第 2 个位置 (channel[-2]), url 在最后 (channel[-1])
-        future_to_channel = {
-            executor.submit(is_url_accessible, channel[-1], channel[-2], 15): channel
-            for channel in channels_to_check
-        }
-
-        # 使用 tqdm 显示进度
-        for future in tqdm(as_completed(future_to_channel), total=len(channels_to_check), desc="Checking URLs"):
-            channel_data = future_to_channel[future]
-            try:
-                if future.result():
-                    accessible_channels.append(channel_data)
-            except Exception:
-                # 发生任何异常（如超时）都认为 URL 不可访问
-                pass
+        list: 包含所有可访问频道的列表（保持输入顺序）。
+    """
+    store = HealthStore(HEALTH_DB_PATH) if HEALTH_DB_PATH else None
+    try:
+        # 指向同一个流的地址（按 canonical_url_key 归一）只探测第一次出现的那个，http 和 https 分别探测；
+        # 有健康记录且未到期的地址直接沿用上次的结果
+        first_channel = {}
+        for channel in channels_to_check:
+            first_channel.setdefault(_probe_key(canonical_url_key(channel[-1]), channel[-1]), channel)
+        representative_urls = [channel[-1] for channel in first_channel.values()]
+        if store:
+            to_check, status = store.plan_checks(representative_urls)
+        else:
+            to_check, status = representative_urls, {}
+        if status:
+            logger.info(f"🗂️ Reusing health history for {len(status)} URLs, {len(to_check)} due for re-check.")
+
+        probe_channels = [first_channel[_probe_key(canonical_url_key(url), url)] for url in to_check]
+
+        logger.info(
+            f"\n🚀 Starting concurrent URL accessibility check for {len(probe_channels)} URLs "
+            f"(mode={URL_CHECK_MODE}, up to {MAX_WORKERS_URL_CHECK} connections, {URL_CHECK_PER_HOST} per host, "
+            f"{URL_CHECK_RATE} req/s)..."
+        )
+        results = check_urls(
+            probe_channels, MAX_WORKERS_URL_CHECK, URL_CHECK_PER_HOST, URL_CHECK_RATE, URL_CHECK_TIMEOUT,
+            URL_CHECK_MODE
+        )
+        if store:
+            store.record_results(zip(to_check, results))
+            removed = store.prune()
+            if removed:
+                logger.info(f"🧹 Removed {removed} stale entries from health history.")
+    finally:
+        if store:
+            store.close()
+
+    for url, result in zip(to_check, results):
+        status[url] = result.ok
+    if probe_health is not None:
+        checked = {_probe_key(canonical_url_key(url), url): result for url, result in zip(to_check, results)}
+        for channel in channels_to_check:
+            result = checked.get(_probe_key(canonical_url_key(channel[-1]), channel[-1]))
+            if result is not None:
+                probe_health[channel[-1]] = (result.ok, result.latency)
+    accessible_channels = [
+        channel for channel in channels_to_check
+        if status[first_channel[_probe_key(canonical_url_key(channel[-1]), channel[-1])][-1]]
+    ]
+
+    latencies = sorted(result.latency for result in results if result.ok and result.latency is not None)
+    if latencies:
+        logger.info(f"⏱️ Median response latency of accessible channels: {latencies[len(latencies) // 2] * 1000:.0f} ms")
 
     inaccessible_count = len(channels_to_check) - len(accessible_channels)
     logger.info(f"✓ Accessible channels: {len(accessible_channels)}")
@@ -87,6 +186,304 @@ def check_urls_concurrently(channels_to_check):
     return accessible_channels
 
 
+def load_stream_scorer(probe_health=None):
+    """
+    根据健康历史（如果存在）构建流排序用的打分函数。
+    probe_health 为本次运行的检查结果（url -> (是否可用, 延迟)），优先于健康历史，之后加入的结果同样生效。
+    """
+    stream_health, host_reliability = {}, {}
+    if HEALTH_DB_PATH and os.path.exists(HEALTH_DB_PATH):
+        with HealthStore(HEALTH_DB_PATH) as store:
+            stream_health = store.load_stream_health()
+            host_reliability = store.load_host_reliability()
+        logger.info(f"🏅 Ranking streams with health history of {len(stream_health)} URLs and {len(host_reliability)} hosts.")
+    if probe_health is not None:
+        stream_health = ChainMap(probe_health, stream_health)
+    return build_stream_scorer(stream_health, host_reliability)
+
+
+def iter_source_channels(urls, downloaded):
+    """按 urls 的顺序逐个解析已下载的源，逐条产出 Channel 记录。"""
+    for url in dict.fromkeys(urls):
+        source = downloaded.get(url)
+        if not source:
+            continue
+        count = 0
+        for channel in iter_m3u_cached(source.path, source.digest, PARSE_CACHE_DIR, source.encoding):
+            count += 1
+            yield channel
+        logger.info(f"✅ Parsed {count} valid channel entries from {url}.")
+
+
+# 工作进程中的频道过滤参数，由 _init_normalize_worker 设置
+_normalize_args = None
+
+
+def _init_normalize_worker(normalize_args):
+    global _normalize_args
+    _normalize_args = normalize_args
+
+
+def _normalize_process_pool(workers, normalize_args):
+    """
+    创建解析/规范化用的进程池。工作进程由 forkserver 启动（平台不支持时使用默认方式），
+    不会从已经启动了下载线程的进程中直接 fork，从而继承其他线程正持有的锁（例如 stdout 的锁）。
+    """
+    context = None
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_normalize_worker,
+                               initargs=(normalize_args,))
+
+
+def _parse_and_normalize_source(source):
+    """
+    工作进程：解析一个已下载的源并逐条规范化（见 normalize_channels）。
+
+    返回:
+        (int, list, set, dict, float): 解析出的频道数, 规范化结果, 匹配到的正式名, 本次的标题缓存统计, 耗时（秒）
+    """
+    started = time.perf_counter()
+    (parse_cache_dir, official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+     alias_matcher, channels_txt_filter, category_filter, category_key) = _normalize_args
+    stats_before = get_title_cache_stats(alias_matcher)
+    channels = list(iter_m3u_cached(source.path, source.digest, parse_cache_dir, source.encoding))
+    processed_official_names = set()
+    normalized = list(normalize_channels(
+        channels, official_names, official_to_aliases, alias_to_official, official_lower_to_original, is_nsfw,
+        channels_txt_filter, category_filter, category_key, processed_official_names, alias_matcher
+    ))
+    stats = {name: value - stats_before[name] for name, value in get_title_cache_stats(alias_matcher).items()}
+    return len(channels), normalized, processed_official_names, stats, time.perf_counter() - started
+
+
+def normalize_sources_in_pool(urls, downloaded, normalize_args, workers, processed_official_names, title_cache_stats):
+    """
+    在进程池中按源并行解析和规范化，按 urls 的顺序逐个产出 normalize_channels 的结果，
+    供 merge_normalized_channels 在主进程中串行合并。
+
+    同时提交的源不超过 workers 个：最早提交的源被合并完之后才提交下一个，
+    内存中最多保留 workers 个源的规范化结果，不随源的数量增长。
+
+    匹配到的正式名加入 processed_official_names，各进程的标题缓存统计累加到 title_cache_stats。
+    """
+    sources = [(url, downloaded[url]) for url in dict.fromkeys(urls) if downloaded.get(url)]
+    with _normalize_process_pool(workers, normalize_args) as executor:
+        pending = deque()
+        next_source = iter(sources)
+        while True:
+            for url, source in next_source:
+                pending.append((url, executor.submit(_parse_and_normalize_source, source)))
+                if len(pending) >= workers:
+                    break
+            if not pending:
+                return
+            url, future = pending.popleft()
+            count, normalized, official_names, stats, _ = future.result()
+            logger.info(f"✅ Parsed {count} valid channel entries from {url}.")
+            processed_official_names.update(official_names)
+            for name, value in stats.items():
+                title_cache_stats[name] = title_cache_stats.get(name, 0) + value
+            yield from normalized
+            # 等待下一个源之前释放已合并的结果
+            del normalized
+
+
+def probe_normalized_sources(sources, prober, store, lookahead, metrics, probe_health=None):
+    """
+    流水线的 URL 检查阶段：按顺序接收各源 normalize_channels 的结果，
+    每个规范化地址（canonical_url_key）只检查第一次出现的那个频道（http 和 https 分别检查），有健康记录且未到期的直接沿用上次的结果；
+    在最多领先 lookahead 条的范围内等待检查结果，按原顺序产出可访问的条目，不可访问的产出 None（计入过滤数量）。
+    给定 probe_health 时，条目产出前把本次的检查结果记录为 url -> (是否可用, 延迟)，合并阶段打分时即可使用。
+    """
+    statuses = {}    # _probe_key -> bool 或 Future[ProbeResult]
+    submitted = []   # (url, Future[ProbeResult])
+    reused = inaccessible = 0
+    pending = deque()
+
+    def status_of(item):
+        return statuses[_probe_key(item[1], item[2][-1])]
+
+    def is_ready(item):
+        return item is None or not hasattr(status_of(item), "result") or status_of(item).done()
+
+    def resolve(item):
+        nonlocal inaccessible
+        if item is None:
+            return None
+        status = status_of(item)
+        if not isinstance(status, bool):
+            result = status.result()
+            if probe_health is not None:
+                probe_health[item[2][-1]] = (result.ok, result.latency)
+            status = result.ok
+        if status:
+            return item
+        inaccessible += 1
+        return None
+
+    for items in sources:
+        first_channel = {}
+        for item in items:
+            if item is not None:
+                key = _probe_key(item[1], item[2][-1])
+                if key not in statuses:
+                    first_channel.setdefault(key, item[2])
+        urls = [channel[-1] for channel in first_channel.values()]
+        to_check, known = store.plan_checks(urls) if store else (urls, {})
+        to_check = set(to_check)
+        reused += len(known)
+        for key, channel in first_channel.items():
+            url = channel[-1]
+            if url in to_check:
+                statuses[key] = prober.submit(channel)
+                submitted.append((url, statuses[key]))
+            else:
+                statuses[key] = known[url]
+
+        pending.extend(items)
+        while pending and (len(pending) > lookahead or is_ready(pending[0])):
+            yield resolve(pending.popleft())
+    while pending:
+        yield resolve(pending.popleft())
+
+    results = [(url, future.result()) for url, future in submitted]
+    for _, result in results:
+        metrics.record(1)
+    metrics.finish()
+    if reused:
+        logger.info(f"🗂️ Reused health history for {reused} URLs, checked {len(results)} URLs.")
+    if store:
+        store.record_results(results)
+        removed = store.prune()
+        if removed:
+            logger.info(f"🧹 Removed {removed} stale entries from health history.")
+    latencies = sorted(result.latency for _, result in results if result.ok and result.latency is not None)
+    if latencies:
+        logger.info(f"⏱️ Median response latency of accessible channels: {latencies[len(latencies) // 2] * 1000:.0f} ms")
+    if inaccessible:
+        logger.warning(f"✗ Inaccessible or timed-out channels: {inaccessible}")
+
+
+def run_pipeline(urls, source_dir, normalize_args, stream_scorer, processed_official_names, title_cache_stats,
+                 probe_health=None):
+    """
+    流水线模式的下载 → 解析/规范化 → URL 检查 → 合并，各阶段同时进行：
+
+    - 下载线程并发下载各源，完成一个即放入 SourceWindow；
+    - 调度线程把窗口内已下载的源交给进程池（PARSE_WORKERS 为 1 时为单个线程）解析和规范化；
+    - 主线程按 urls 的顺序取出结果（重排缓冲），URL_CHECK 时交给后台探测器检查，再由 merge_normalized_channels 串行合并。
+    窗口（PIPELINE_WINDOW）和检查的领先条数（PIPELINE_PROBE_LOOKAHEAD）限制了内存中的中间结果。
+    下载或调度线程异常退出、或解析进程崩溃时，异常记录在窗口上并由主线程重新抛出，不会一直等待。
+
+    匹配到的正式名加入 processed_official_names，各进程的标题缓存统计累加到 title_cache_stats；
+    URL_CHECK 时本次的检查结果陆续加入 probe_health（见 probe_normalized_sources），stream_scorer 应以它构建。
+
+    返回:
+        list: 最终的 Channel 列表
+    """
+    urls = list(dict.fromkeys(urls))
+    index_of = {url: index for index, url in enumerate(urls)}
+    window = SourceWindow(len(urls), PIPELINE_WINDOW)
+    workers = max(1, min(PARSE_WORKERS or os.cpu_count() or 1, len(urls)))
+    fetch_metrics = StageMetrics("fetch", "bytes")
+    parse_metrics = StageMetrics("parse+normalize", "channels")
+    probe_metrics = StageMetrics("url check", "urls")
+    merge_metrics = StageMetrics("merge", "channels")
+
+    def fetch_stage():
+        try:
+            for url, source in fetch_playlists_concurrently(
+                urls, source_dir, MAX_WORKERS_FETCH, MAX_FETCH_PER_HOST, FETCH_DEADLINE
+            ):
+                fetch_metrics.record(os.path.getsize(source.path) if source else 0)
+                window.arrive(index_of[url], source)
+        except Exception as e:
+            logger.error(f"❌ Pipeline fetch stage failed: {e}")
+            window.fail(e)
+        finally:
+            fetch_metrics.finish()
+            window.close()
+
+    def on_parsed(index, future):
+        try:
+            result = future.result()
+        except BrokenExecutor as e:
+            # 工作进程崩溃后进程池不再可用，其余的源也无法解析
+            logger.error(f"❌ Parse workers died while parsing {urls[index]}: {e}")
+            window.fail(e)
+            return
+        except Exception as e:
+            logger.error(f"❌ Failed to parse {urls[index]}: {e}")
+            result = None
+        window.complete(index, result)
+
+    def dispatch_stage(executor):
+        try:
+            while (ready := window.next_ready()) is not None:
+                index, source = ready
+                if source is None:
+                    window.complete(index, None)
+                    continue
+                future = executor.submit(_parse_and_normalize_source, source)
+                future.add_done_callback(lambda future, index=index: on_parsed(index, future))
+        except Exception as e:
+            logger.error(f"❌ Pipeline dispatch stage failed: {e}")
+            window.fail(e)
+
+    def ordered_sources():
+        for url, result in zip(urls, window.results()):
+            if result is None:
+                continue
+            count, normalized, official_names, stats, elapsed = result
+            logger.info(f"✅ Parsed {count} valid channel entries from {url}.")
+            parse_metrics.record(count, elapsed)
+            processed_official_names.update(official_names)
+            for name, value in stats.items():
+                title_cache_stats[name] = title_cache_stats.get(name, 0) + value
+            yield normalized
+        parse_metrics.finish()
+
+    def counted(items):
+        count = 0
+        for item in items:
+            count += 1
+            yield item
+        merge_metrics.record(count)
+
+    logger.info(f"🧩 Pipeline: {len(urls)} sources, {workers} parse workers, window of {PIPELINE_WINDOW} sources"
+                f"{', URL check enabled' if URL_CHECK else ''}.")
+    if workers > 1:
+        executor = _normalize_process_pool(workers, normalize_args)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1, initializer=_init_normalize_worker, initargs=(normalize_args,))
+    with executor:
+        threading.Thread(target=fetch_stage, name="pipeline-fetch", daemon=True).start()
+        threading.Thread(target=dispatch_stage, args=(executor,), name="pipeline-dispatch", daemon=True).start()
+
+        if URL_CHECK:
+            store = HealthStore(HEALTH_DB_PATH) if HEALTH_DB_PATH else None
+            try:
+                with BackgroundProber(MAX_WORKERS_URL_CHECK, URL_CHECK_PER_HOST, URL_CHECK_RATE, URL_CHECK_TIMEOUT,
+                                      URL_CHECK_MODE) as prober:
+                    normalized = probe_normalized_sources(ordered_sources(), prober, store,
+                                                          PIPELINE_PROBE_LOOKAHEAD, probe_metrics, probe_health)
+                    final_channels = merge_normalized_channels(counted(normalized), stream_scorer,
+                                                               MAX_STREAMS_PER_CHANNEL)
+            finally:
+                if store:
+                    store.close()
+        else:
+            normalized = (item for items in ordered_sources() for item in items)
+            final_channels = merge_normalized_channels(counted(normalized), stream_scorer, MAX_STREAMS_PER_CHANNEL)
+        merge_metrics.finish()
+
+    for metrics in (fetch_metrics, parse_metrics, probe_metrics if URL_CHECK else None, merge_metrics):
+        if metrics:
+            logger.info(f"📈 {metrics.summary()}")
+    return final_channels
+
+
 def main():
     os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
     start_time = datetime.now()
@@ -97,30 +494,74 @@ def main():
     official_to_aliases = {}
     alias_to_official = {}
     official_lower_to_original = {}
+    alias_matcher = None
     if CHANNELS_TXT_FILTER:
         logger.info(f"📂 Loading allowed channels from {CHANNELS_TXT_PATH}...")
-        official_names, official_to_aliases, alias_to_official, official_lower_to_original = load_channels_txt(CHANNELS_TXT_PATH)
+        (official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+         alias_matcher) = load_channels_txt(CHANNELS_TXT_PATH)
         logger.info(f"✅ Loaded {len(official_names)} official channels and {len(alias_to_official)} aliases.")
     else:
         logger.warning("⚠️ CHANNELS_TXT_FILTER is False, skipping channels.txt filter.")
 
-    all_channels = []
-    for url in playlist_urls:
-        content = fetch_playlist_content(url)
-        if content:
-            parsed_channels = parse_m3u(content)
-            logger.info(f"✅ Parsed {len(parsed_channels)} valid channel entries from {url}.")
-            all_channels.extend(parsed_channels)
-
-    if URL_CHECK:
-        all_channels = check_urls_concurrently(all_channels)
-
-    # --- 优化步骤：只处理可访问的频道 ---
-    processed_channels, processed_official_names = process_and_normalize_channels(
-        all_channels, official_names, official_to_aliases, alias_to_official, official_lower_to_original,
-        is_nsfw, CHANNELS_TXT_FILTER, CategoryFilter, Category_Key
-    )
-    write_merged_playlist(processed_channels, EPG_URL, OUTPUT_FILE)
+    source_dir = SOURCE_CACHE_DIR or tempfile.mkdtemp(prefix="iptv-sources-")
+    normalize_args = (PARSE_CACHE_DIR, official_names, official_to_aliases, alias_to_official,
+                      official_lower_to_original, alias_matcher, CHANNELS_TXT_FILTER, CategoryFilter, Category_Key)
+    processed_official_names = set()
+    title_cache_stats = {}
+
+    if PIPELINE:
+        # 下载、解析/规范化、URL 检查和合并同时进行；检查结果边产生边加入 probe_health，供合并时打分
+        logger.info(f"🌐 Fetching {len(playlist_urls)} sources (up to {MAX_WORKERS_FETCH} workers, {MAX_FETCH_PER_HOST} per host)...")
+        probe_health = {}
+        stream_scorer = load_stream_scorer(probe_health) if MAX_STREAMS_PER_CHANNEL else None
+        processed_channels = run_pipeline(playlist_urls, source_dir, normalize_args, stream_scorer,
+                                          processed_official_names, title_cache_stats, probe_health)
+    else:
+        # 并发下载所有源，正文以流式方式直接落盘
+        logger.info(f"🌐 Fetching {len(playlist_urls)} sources (up to {MAX_WORKERS_FETCH} workers, {MAX_FETCH_PER_HOST} per host)...")
+        downloaded = {}
+        for url, source in fetch_playlists_concurrently(
+            playlist_urls, source_dir, MAX_WORKERS_FETCH, MAX_FETCH_PER_HOST, FETCH_DEADLINE
+        ):
+            if source:
+                downloaded[url] = source
+        logger.info(f"✅ Downloaded {len(downloaded)} of {len(playlist_urls)} sources.")
+
+        workers = min(PARSE_WORKERS or os.cpu_count() or 1, len(downloaded))
+        if workers > 1 and not URL_CHECK:
+            # 多进程：各源的解析和逐条过滤并行执行，去重和 TVG 信息统一仍按源的顺序在主进程中完成
+            logger.info(f"🧩 Parsing and normalizing {len(downloaded)} sources in {workers} worker processes...")
+            stream_scorer = load_stream_scorer() if MAX_STREAMS_PER_CHANNEL else None
+            normalized = normalize_sources_in_pool(playlist_urls, downloaded, normalize_args, workers,
+                                                   processed_official_names, title_cache_stats)
+            processed_channels = merge_normalized_channels(normalized, stream_scorer, MAX_STREAMS_PER_CHANNEL)
+        else:
+            # 按 playlist_urls 的顺序逐个源惰性解析，保证输出与下载完成顺序无关，且内存占用不随源大小增长
+            all_channels = iter_source_channels(playlist_urls, downloaded)
+
+            probe_health = {}
+            if URL_CHECK:
+                all_channels = check_urls_concurrently(list(all_channels), probe_health)
+            # 打分函数在检查之后构建，使用本次的检查结果
+            stream_scorer = load_stream_scorer(probe_health) if MAX_STREAMS_PER_CHANNEL else None
+
+            # --- 优化步骤：只处理可访问的频道 ---
+            processed_channels, processed_official_names = process_and_normalize_channels(
+                all_channels, official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+                is_nsfw, CHANNELS_TXT_FILTER, CategoryFilter, Category_Key, alias_matcher=alias_matcher,
+                stream_scorer=stream_scorer, max_streams_per_channel=MAX_STREAMS_PER_CHANNEL
+            )
+    write_merged_playlist(processed_channels, EPG_URL + ".gz" if EPG_URL_USE_GZIP else EPG_URL, OUTPUT_FILE)
+
+    removed = prune_parse_cache(PARSE_CACHE_DIR)
+    if removed:
+        logger.info(f"🧹 Removed {removed} stale parse cache files.")
+    if SOURCE_CACHE_DIR:
+        removed = prune_source_cache(SOURCE_CACHE_DIR, playlist_urls)
+        if removed:
+            logger.info(f"🧹 Removed {removed} cached files of sources no longer in playlist_urls.")
+    else:
+        shutil.rmtree(source_dir, ignore_errors=True)
 
     # 检查缺失的频道
     if CHANNELS_TXT_FILTER and official_names:
@@ -132,6 +573,14 @@ def main():
         else:
             logger.info(f"\n✅ All {len(official_names)} channels from {CHANNELS_TXT_PATH} found in sources.")
 
+    stats = get_title_cache_stats(alias_matcher)
+    for name, value in title_cache_stats.items():
+        stats[name] += value
+    logger.info(
+        f"🧮 Title cache: normalize {stats['normalize_hits']} hits / {stats['normalize_misses']} misses, "
+        f"match {stats['match_hits']} hits / {stats['match_misses']} misses."
+    )
+
     end_time = datetime.now()
     logger.info(f"\n✨ Merging complete at {end_time.strftime('%Y-%m-%d %H:%M:%S')}.")
     logger.info(f"⏱️ Total execution time: {(end_time - start_time).total_seconds():.2f} seconds.")
@@ -0,0 +1,113 @@
+# scripts/bench_epg_parse.py
+"""
+EPG 解析后端基准：生成一个与 epg_ripper_ALL_SOURCES1 结构相近的合成 XMLTV 文件（gzip），
+分别用标准库和 lxml 后端完整扫描一遍（与 scan_epg_source 相同的事件处理），对比耗时和进程峰值内存。
+
+每个后端在独立的子进程中运行，峰值内存取自子进程的 ru_maxrss（仅 Linux / macOS）。
+
+用法：
+    python scripts/bench_epg_parse.py [频道数] [每个频道的节目数]
+"""
+import os
+import sys
+import gzip
+import time
+import random
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from scripts.epg_getcher import iter_epg_events, lxml_etree
+from utils.xmltv import escape_xml
+
+
+def build_xmltv(path, channel_count, programmes_per_channel, seed=42):
+    """生成合成 XMLTV：每个节目带 title、desc、category、icon 等子节点，写入 gzip 文件。"""
+    rng = random.Random(seed)
+    categories = ["News", "Sports", "Movie", "Kids", "Music", "Documentary", "Series"]
+    start = 1_760_000_000
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv date="20251010" generator-info-name="bench">\n')
+        for i in range(channel_count):
+            f.write(f'  <channel id="channel{i}.xx">\n'
+                    f'    <display-name lang="en">Channel {i}</display-name>\n'
+                    f'    <icon src="https://example.com/logos/{i}.png" />\n'
+                    f'    <url>https://example.com/{i}</url>\n'
+                    f'  </channel>\n')
+        for i in range(channel_count):
+            current = start
+            for k in range(programmes_per_channel):
+                duration = rng.choice([1800, 3600, 5400, 7200])
+                begin = time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(current))
+                end = time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(current + duration))
+                title = escape_xml(f"Show {k} & Friends")
+                f.write(f'  <programme start="{begin}" stop="{end}" channel="channel{i}.xx">\n'
+                        f'    <title lang="en">{title}</title>\n'
+                        f'    <sub-title lang="en">Episode {k}</sub-title>\n'
+                        f'    <desc lang="en">{"A fairly long description of the programme. " * 4}</desc>\n'
+                        f'    <category lang="en">{rng.choice(categories)}</category>\n'
+                        f'    <icon src="https://example.com/img/{i}-{k}.jpg" />\n'
+                        f'    <episode-num system="onscreen">S1 E{k}</episode-num>\n'
+                        f'  </programme>\n')
+                current += duration
+        f.write('</tv>\n')
+
+
+def scan(path, backend):
+    """与 scan_epg_source 相同的事件处理，返回 (耗时, 频道数, 节目数, 峰值 RSS MB)。"""
+    started = time.perf_counter()
+    channels = programmes = 0
+    for event, elem in iter_epg_events(path, backend):
+        if event == "start":
+            continue
+        if elem.tag == "channel":
+            elem.get("id")
+            elem.find("display-name")
+            channels += 1
+        elif elem.tag == "programme":
+            elem.get("channel")
+            elem.get("start")
+            elem.get("stop")
+            elem.find("title")
+            programmes += 1
+    elapsed = time.perf_counter() - started
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    return elapsed, channels, programmes, max_rss / 1e6
+
+
+def main():
+    channel_count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    programmes_per_channel = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    backends = ["stdlib"] + (["lxml"] if lxml_etree is not None else [])
+    if lxml_etree is None:
+        print("⚠️ lxml is not installed, only the stdlib backend will be measured.")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.xml.gz")
+        build_xmltv(path, channel_count, programmes_per_channel)
+        print(f"📄 Synthetic XMLTV: {channel_count} channels, {channel_count * programmes_per_channel} programmes, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB gzip")
+
+        results = {}
+        for backend in backends:
+            # 每个后端使用全新的子进程，避免峰值内存互相影响
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results[backend] = executor.submit(scan, path, backend).result()
+            elapsed, channels, programmes, max_rss = results[backend]
+            print(f"⏱️ {backend:6}: {elapsed:7.2f} s, {channels} channels, {programmes} programmes, "
+                  f"peak RSS {max_rss:6.1f} MB")
+
+        if "lxml" in results:
+            print(f"🚀 Speedup: {results['stdlib'][0] / results['lxml'][0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
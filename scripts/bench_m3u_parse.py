@@ -0,0 +1,114 @@
+# scripts/bench_m3u_parse.py
+"""
+parse_m3u 微基准：生成一个数 MB 的合成播放列表，对比旧版（逐属性 re.search、普通元组）与当前实现的
+解析耗时和解析结果的内存占用（tracemalloc）。
+
+用法：
+    python scripts/bench_m3u_parse.py [频道数] [重复次数]
+"""
+import os
+import re
+import sys
+import random
+import timeit
+import tracemalloc
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from utils.m3u_parse import parse_m3u
+
+
+def legacy_parse_m3u(m3u_content):
+    """旧版 parse_m3u：每个频道调用四次 re.search，仅用于对比。"""
+    if not m3u_content:
+        return []
+
+    def get_attr(pattern, text):
+        match = re.search(pattern, text)
+        return match.group(1) if match else None
+
+    lines = m3u_content.splitlines()
+    channels = []
+    extinf = None
+    headers = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            extinf = line
+            headers = []
+        elif line.startswith('#') and extinf:
+            headers.append(line)
+        elif extinf and not line.startswith('#'):
+            url = line
+            tvg_id = get_attr(r'tvg-id="([^"]+)"', extinf)
+            tvg_name = get_attr(r'tvg-name="([^"]+)"', extinf)
+            tvg_logo = get_attr(r'tvg-logo="([^"]+)"', extinf)
+            group_title = get_attr(r'group-title="([^"]+)"', extinf)
+            title = extinf.rsplit(",", 1)[-1].strip()
+            channels.append((tvg_name, tvg_id, tvg_logo, group_title, title, tuple(headers), url))
+            extinf = None
+            headers = []
+    return channels
+
+
+def build_playlist(channel_count, seed=42):
+    """生成与 iptv-org index.m3u 结构相近的合成播放列表。"""
+    rng = random.Random(seed)
+    groups = ["News", "Sports", "Movies", "Kids", "Music", "Documentary", "General"]
+    names = ["CNN", "ESPN", "CCTV-5", "BBC News", "Fox Sports 1", "Sky Sports F1", "TSN 2", "Local TV"]
+    lines = ["#EXTM3U"]
+    for i in range(channel_count):
+        name = f"{rng.choice(names)} {i % 997}"
+        suffix = rng.choice(["", " (1080p)", " (720p)", " [Geo-blocked]"])
+        lines.append(
+            f'#EXTINF:-1 tvg-id="{name.replace(" ", "")}.xx" tvg-name="{name}" '
+            f'tvg-logo="https://i.imgur.com/{i % 5000:05d}.png" group-title="{rng.choice(groups)}",{name}{suffix}'
+        )
+        if i % 8 == 0:
+            lines.append("#EXTVLCOPT:http-referrer=https://example.com/")
+            lines.append("#EXTVLCOPT:http-user-agent=Mozilla/5.0")
+        lines.append(f"https://stream{i % 300}.example.com/live/{i}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def measure_memory(parse_func, content):
+    """返回解析结果常驻内存的字节数。"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    channels = parse_func(content)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del channels
+    return after - before
+
+
+def main():
+    channel_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    content = build_playlist(channel_count)
+    print(f"📄 Synthetic playlist: {channel_count} channels, {len(content.encode('utf-8')) / 1e6:.1f} MB")
+
+    if [tuple(c) for c in parse_m3u(content)] != legacy_parse_m3u(content):
+        print("❌ Results differ between legacy and current parser!")
+        sys.exit(1)
+
+    legacy = min(timeit.repeat(lambda: legacy_parse_m3u(content), number=1, repeat=repeat))
+    current = min(timeit.repeat(lambda: parse_m3u(content), number=1, repeat=repeat))
+    print(f"⏱️ legacy parse_m3u : {legacy * 1000:8.1f} ms")
+    print(f"⏱️ current parse_m3u: {current * 1000:8.1f} ms")
+    print(f"🚀 Speedup: {legacy / current:.2f}x")
+
+    legacy_bytes = measure_memory(legacy_parse_m3u, content)
+    current_bytes = measure_memory(parse_m3u, content)
+    print(f"💾 legacy result size : {legacy_bytes / 1e6:8.1f} MB")
+    print(f"💾 current result size: {current_bytes / 1e6:8.1f} MB ({current_bytes / legacy_bytes:.0%} of legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,23 @@ import sys
 import traceback
 import logging
 import xml.etree.ElementTree as ET
-# 导入 minidom 库用于美化 XML 输出
-from xml.dom import minidom
 
 import requests
 import gzip
-import io
+import lzma
+import time
+import bisect
+import hashlib
+import pickle
+import tempfile
+from typing import NamedTuple, Optional
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml 为可选依赖，未安装时使用标准库解析
+    lxml_etree = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,20 +44,87 @@ def looks_like_xml(content: bytes) -> bool:
     return sample.startswith(b"<?xml") or sample.startswith(b"<tv") or sample.startswith(bytes([60, 33, 10]))
 
 
-def get_epg_fileobj(raw_content: bytes):
-    """按 EPG_URL 返回的原始格式返回可迭代解析的文件对象，避免写入巨大临时文件。"""
-    if is_gzip_bytes(raw_content):
-        return gzip.GzipFile(fileobj=io.BytesIO(raw_content))
-    return io.BytesIO(raw_content)
+def get_epg_fileobj(epg_path: str):
+    """按下载文件的实际格式（根据文件头判断）返回可流式解析的文件对象，gzip 在解析时边读边解压。"""
+    with open(epg_path, "rb") as f:
+        head = f.read(2)
+    if is_gzip_bytes(head):
+        return gzip.open(epg_path, "rb")
+    return open(epg_path, "rb")
 
 
-def iter_epg_elements(raw_content: bytes, target_tag: str | None = None):
-    """按 EPG 原始格式流式迭代 XML 元素，避免一次性加载巨大解压内容。"""
-    with get_epg_fileobj(raw_content) as epg_file:
-        for _, elem in ET.iterparse(epg_file, events=("end",)):
-            if target_tag is None or elem.tag == target_tag:
-                yield elem
+def _iter_events_stdlib(epg_file):
+    """
+    标准库后端：ET.iterparse 会为每个元素（包括 <desc>、<category> 等不需要的子节点）产生事件，
+    由调用方按 tag 过滤。每个顶层节点的 end 事件被处理后即从根节点上移除。
+    """
+    root = None
+    for event, elem in ET.iterparse(epg_file, events=("start", "end")):
+        if root is None:
+            root = elem
+        yield event, elem
+        if event == "end" and elem.tag in ("channel", "programme"):
+            root.clear()
+
 
+def _iter_events_lxml(epg_file):
+    """
+    lxml 后端：iterparse 只对 <channel> / <programme> 产生 end 事件，子节点不再逐个回到 Python 层。
+    第一个节点之前先产生一次根节点的 start 事件（此时根节点的属性已解析），
+    处理完的节点用 clear + 删除前面的兄弟节点的方式释放。
+    语法错误统一转换为 ET.ParseError（lxml 的异常无法在进程间传递）。
+    """
+    root = None
+    try:
+        for _, elem in lxml_etree.iterparse(epg_file, events=("end",), tag=("channel", "programme"),
+                                            huge_tree=True, resolve_entities=False):
+            parent = elem.getparent()
+            if root is None:
+                root = parent
+                yield "start", root
+            yield "end", elem
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del parent[0]
+    except lxml_etree.XMLSyntaxError as e:
+        raise ET.ParseError(str(e)) from None
+
+
+EPG_PARSER_BACKENDS = {
+    "stdlib": _iter_events_stdlib,
+    "lxml": _iter_events_lxml,
+}
+
+
+def get_epg_parser_backend(name=None):
+    """返回解析后端名称：name（默认 EPG_PARSER）为 "auto" 时，安装了 lxml 则使用 lxml，否则使用标准库。"""
+    name = name or EPG_PARSER
+    if name == "auto":
+        return "lxml" if lxml_etree is not None else "stdlib"
+    if name == "lxml" and lxml_etree is None:
+        raise ImportError("EPG_PARSER is 'lxml' but lxml is not installed")
+    return name
+
+
+def iter_epg_events(epg_path: str, backend=None):
+    """
+    按 EPG 文件的格式流式迭代 XML 的 start/end 事件，避免一次性加载巨大解压内容。
+    调用方只需处理 <tv> 的 start 事件以及 <channel> / <programme> 的 end 事件，其他事件是否出现取决于后端。
+    每个顶层节点的 end 事件被处理后即被释放，内存占用与文件大小无关。
+    """
+    iter_events = EPG_PARSER_BACKENDS[get_epg_parser_backend(backend)]
+    with get_epg_fileobj(epg_path) as epg_file:
+        yield from iter_events(epg_file)
+
+
+def _iter_spooled(spool):
+    """从头读取 spool 临时文件中逐条 pickle 的记录。"""
+    spool.seek(0)
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
 
 
 # --- 路径配置 ---
@@ -61,8 +139,14 @@ if os.path.basename(sys.path[0]) == "scripts":
 
 # 导入我们需要的 m3u 解析工具
 from utils.m3u_parse import parse_m3u
-
-# EPG 源地址列表（按优先级排序，主源失效时自动尝试备用源）
+from utils.channel_filter import load_channels_txt, TitleIndex
+from utils.xmltv import XMLTVWriter, XMLTVWriterGroup, TeeFile, parse_xmltv_time
+from utils.epg_index import build_programme_index, write_programme_index
+from utils.epg_cache import (build_source_fingerprint, hash_playlist_channels, load_epg_channel_cache,
+                             save_epg_channel_cache)
+
+# EPG 源地址列表（按优先级排序）：所有源并行下载和解析后合并，
+# 同一频道优先使用排在前面的源的节目，后面的源只补充与已有节目时间不重叠的部分
 EPG_URLS = [
     "https://epgshare01.online/epgshare01/epg_ripper_ALL_SOURCES1.xml.gz",
     "http://epg.51zmt.top:8000/e.xml",
@@ -71,53 +155,146 @@ EPG_URLS = [
 
 # 定义输入和输出文件路径
 PLAYLIST_PATH = os.path.join(OUT_DIR, "MergedCleanPlaylist.m3u8")
+# 频道正式名和别名列表，EPG 频道名通过它匹配到播放列表中的正式名
+CHANNELS_TXT_PATH = os.path.join(PROJECT_ROOT, "channels.txt")
 FINAL_EPG_PATH = os.path.join(OUT_DIR, "DrewLive3.xml")
 
+# 与 DrewLive3.xml 同时写出的压缩版本和紧凑（无缩进、无换行）版本，设为 None 表示不生成。
+# 压缩流与原始文件在写入时同步生成；gzip 头中不记录文件名和时间，内容不变时输出逐字节相同
+EPG_GZIP_PATH = FINAL_EPG_PATH + ".gz"
+EPG_XZ_PATH = None
+EPG_COMPACT_PATH = None
+
+# 输出 EPG 的缩进；None 表示不缩进、不换行的紧凑输出
+EPG_INDENT = "  "
+
+# 流式下载 EPG 时每次读取的块大小，以及连接中断后的续传次数
+EPG_DOWNLOAD_CHUNK_SIZE = 1 << 16
+EPG_DOWNLOAD_RETRIES = 3
+
+# 节目时间窗口：只保留结束时间晚于 "现在 - EPG_WINDOW_PAST_HOURS" 且开始时间早于 "现在 + EPG_WINDOW_FUTURE_HOURS" 的节目；
+# 设为 None 表示该方向不限制。时间无法解析的节目总是保留
+EPG_WINDOW_PAST_HOURS = 6
+EPG_WINDOW_FUTURE_HOURS = 48
+
+# 按频道排序的节目索引（JSON），用于快速查询当前节目（见 utils.epg_index.find_programme）；设为 None 表示不生成
+EPG_INDEX_PATH = None
+
+# EPG 解析后端："auto" 在安装了 lxml 时使用 lxml（只对需要的节点产生事件，速度更快），否则使用标准库；
+# 也可以指定 "lxml" 或 "stdlib"
+EPG_PARSER = "auto"
+
+# 并行解析 EPG 源的进程数；None 表示取源数量和 CPU 核数中的较小值
+EPG_PARSE_WORKERS = None
+
+# EPG 频道映射缓存目录：源的指纹（ETag、大小、sha256）和播放列表的频道集合都未变化时跳过频道解析和映射计算；
+# 设为 None 关闭缓存
+EPG_CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache", "epg")
+
+
+class EpgSource(NamedTuple):
+    """已下载到本地的 EPG 源。"""
+    url: str
+    path: str
+    fingerprint: Optional[str] = None   # 见 utils.epg_cache.build_source_fingerprint；None 表示不使用缓存
+
+
+def stream_epg_to_file(epg_url, dest_path):
+    """
+    以流式方式把 EPG 下载到 dest_path，内存占用与 EPG 大小无关。
+
+    收到第一个数据块时即根据文件头判断格式，不是 gzip 也不像 XML 时立即放弃（抛出 ValueError）。
+    下载中途连接中断时，若服务器支持 Range（Accept-Ranges: bytes 且正文未经 Content-Encoding 压缩），
+    从已写入的位置续传；否则重新下载。
+
+    返回:
+        (int, str, str, str): 写入的字节数, Content-Type, ETag（可能为 None）, 正文 sha256
+    """
+    written = 0
+    resumable = False
+    etag = None
+    hasher = hashlib.sha256()
+    for attempt in range(EPG_DOWNLOAD_RETRIES + 1):
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if written and resumable:
+            headers["Range"] = f"bytes={written}-"
+            if etag:
+                # 文件在两次请求之间发生变化时，服务器会返回完整的 200 响应
+                headers["If-Range"] = etag
+        try:
+            with requests.get(epg_url, timeout=120, headers=headers, stream=True) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # 首次请求，或服务器忽略了 Range：从头写入
+                    written = 0
+                    hasher = hashlib.sha256()
+                    etag = response.headers.get("etag")
+                    resumable = (response.headers.get("accept-ranges", "").lower() == "bytes"
+                                 and not response.headers.get("content-encoding"))
+                content_type = response.headers.get("content-type", "n/a")
+                with open(dest_path, "ab" if written else "wb") as f:
+                    for chunk in response.iter_content(EPG_DOWNLOAD_CHUNK_SIZE):
+                        if not written and not (is_gzip_bytes(chunk) or looks_like_xml(chunk)):
+                            preview = chunk[:500].decode("utf-8", errors="replace")
+                            raise ValueError(f"not gzipped XML or XML text. Response preview:\n{preview}")
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        written += len(chunk)
+            return written, content_type, etag, hasher.hexdigest()
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout) as e:
+            if attempt == EPG_DOWNLOAD_RETRIES:
+                raise
+            if written and resumable:
+                logger.warning(f"⚠️ EPG download interrupted after {written} bytes ({e}), resuming...")
+            else:
+                logger.warning(f"⚠️ EPG download interrupted ({e}), retrying from the beginning...")
+
+
+def _download_epg_source(epg_url):
+    """下载单个 EPG 源到临时文件，返回 EpgSource；失败时返回 None。"""
+    fd, epg_path = tempfile.mkstemp(prefix="epg-", suffix=".download")
+    os.close(fd)
+    logger.info(f"📥  Downloading EPG from {epg_url}...")
+    try:
+        size, content_type, etag, digest = stream_epg_to_file(epg_url, epg_path)
+        with open(epg_path, "rb") as f:
+            head = f.read(2)
+        epg_format = "gzip" if is_gzip_bytes(head) else "plain XML"
+        logger.info(f"✅ EPG downloaded from {epg_url}: {size} bytes ({epg_format}), Content-Type: {content_type}")
+        return EpgSource(epg_url, epg_path, build_source_fingerprint(etag, size, digest))
+    except ValueError as e:
+        logger.error(f"❌ EPG response from {epg_url} is {e}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"❌ EPG download failed from {epg_url}: {e}")
+    except OSError as e:
+        logger.error(f"❌ EPG processing failed from {epg_url}: {e}")
+        traceback.print_exc()
+    os.remove(epg_path)
+    return None
+
 
 def download_epg():
     """
-    下载 EPG 内容，并按返回格式流式解析。
+    并行下载 EPG_URLS 中的所有源到临时文件，总耗时约等于最慢的那个源。
+    调用方负责在处理完成后删除这些文件。
 
     支持 EPG_URL 返回以下格式：
     1. gzip 二进制（.gz 或文件头 1f 8b）
     2. 普通 XML 文本
     3. URL 重定向后仍是 XML 文本
     4. 错误页面/非 XML 文本（明确失败，避免后续按 XML 解析崩溃）
-    """
-    raw_content = None
-    for epg_url in EPG_URLS:
-        logger.info(f"📥  Trying to download EPG from {epg_url}...")
-        try:
-            response = requests.get(epg_url, timeout=120, headers={"User-Agent": "Mozilla/5.0"})
-            response.raise_for_status()
-            os.makedirs(OUT_DIR, exist_ok=True)
-
-            raw_content = response.content
-            logger.info(f"ℹ️  Raw EPG bytes: {len(raw_content)} bytes, Content-Type: {response.headers.get('content-type', 'n/a')}")
-
-            if is_gzip_bytes(raw_content):
-                logger.info("ℹ️  Detected gzip EPG, streaming decompression during parsing...")
-            elif looks_like_xml(raw_content):
-                logger.info("ℹ️  Detected plain XML EPG, streaming parsing...")
-            else:
-                preview = raw_content[:500].decode("utf-8", errors="replace")
-                logger.error(f"❌ EPG response from {epg_url} is not gzipped XML or XML text. Response preview:\n{preview}")
-                raw_content = None
-                continue
-
-            logger.info(f"✅ EPG downloaded successfully from {epg_url}; parsing without writing a huge decompressed temp file.")
-            return raw_content
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ EPG download failed from {epg_url}: {e}")
-            continue
-        except (OSError, UnicodeDecodeError, gzip.BadGzipFile, ET.ParseError) as e:
-            logger.error(f"❌ EPG processing failed from {epg_url}: {e}")
-            traceback.print_exc()
-            raw_content = None
-            continue
 
-    logger.error("❌ All EPG sources failed. Cannot proceed.")
-    return False
+    返回:
+        list: 下载成功的 EpgSource，按 EPG_URLS 的优先级排序；全部失败时返回 False
+    """
+    with ThreadPoolExecutor(max_workers=len(EPG_URLS) or 1) as executor:
+        sources = [source for source in executor.map(_download_epg_source, EPG_URLS) if source]
+    if not sources:
+        logger.error("❌ All EPG sources failed. Cannot proceed.")
+        return False
+    logger.info(f"✅ Downloaded {len(sources)} of {len(EPG_URLS)} EPG sources.")
+    return sources
 
 def get_channel_data_from_playlist():
     """
@@ -149,142 +326,390 @@ def get_channel_data_from_playlist():
 
     return playlist_id_to_title, playlist_title_to_id
 
-def clean_and_compress_epg(raw_content: bytes):
+def build_master_map(epg_channels, playlist_id_to_title, title_index, master_map, matched_names):
     """
-    【核心重构】使用两步处理法，健壮地筛选并简化 EPG。
-    1. 从 EPG_URL 原始内容流式扫描，建立 `epg_id -> epg_name` 的完整地图。
-    2. 根据播放列表和 EPG 地图，建立一个 `epg_id -> final_title` 的主映射。
-    3. 再次流式扫描 EPG 内容，使用主映射来生成高度简化的新 EPG。
+    把 epg_channels (epg_id -> 全部 display-name) 中能与播放列表匹配的频道加入 master_map (epg_id -> final_title)。
+    title_index 为播放列表标题的 TitleIndex，频道名匹配会经过 channels.txt 的正式名/别名归一。
+    matched_names 记录已通过频道名匹配过的名称，同名的 EPG 频道只取第一个。
+
+    返回:
+        set: 本次新加入 master_map 的 epg_id
     """
-    playlist_id_to_title, playlist_title_to_id = get_channel_data_from_playlist()
-    if not playlist_id_to_title:
-        logger.warning("⚠️ No valid channel data found. Aborting EPG cleaning.")
+    added = set()
+    for epg_id, epg_names in epg_channels.items():
+        # 优先策略：通过 tvg-id 匹配
+        if epg_id in playlist_id_to_title:
+            master_map[epg_id] = playlist_id_to_title[epg_id]
+            added.add(epg_id)
+            continue
+        # 备用策略：通过频道名匹配（所有 display-name，先精确匹配，再按正式名/别名匹配）
+        final_title = title_index.lookup(epg_names)
+        if final_title is not None and final_title not in matched_names:
+            master_map[epg_id] = final_title
+            matched_names.add(final_title)
+            added.add(epg_id)
+    return added
+
+
+def get_epg_window(now=None):
+    """根据 EPG_WINDOW_* 配置返回 (窗口开始, 窗口结束) 的 Unix 时间戳，不限制的一侧为 None。"""
+    now = time.time() if now is None else now
+    window_start = now - EPG_WINDOW_PAST_HOURS * 3600 if EPG_WINDOW_PAST_HOURS is not None else None
+    window_end = now + EPG_WINDOW_FUTURE_HOURS * 3600 if EPG_WINDOW_FUTURE_HOURS is not None else None
+    return window_start, window_end
+
+
+def in_epg_window(start_ts, stop_ts, window):
+    """节目是否与时间窗口有交集；时间无法解析时视为在窗口内。"""
+    window_start, window_end = window
+    if window_start is not None and stop_ts is not None and stop_ts <= window_start:
         return False
+    if window_end is not None and start_ts is not None and start_ts >= window_end:
+        return False
+    return True
 
-    valid_playlist_ids = set(playlist_id_to_title.keys())
-    valid_playlist_titles = set(playlist_title_to_id.keys())
 
-    # --- Pass 1: 快速扫描 EPG，建立原始频道地图 ---
-    logger.info("🔍 Pass 1: Scanning EPG to map original channel IDs to names...")
-    epg_id_to_name_map = {}
-    try:
-        for elem in iter_epg_elements(raw_content, 'channel'):
-            channel_id = elem.get('id')
-            display_name_node = elem.find('display-name')
-            if channel_id and display_name_node is not None and display_name_node.text:
-                epg_id_to_name_map[channel_id] = display_name_node.text
-            # 清理元素以释放内存
-            elem.clear()
+def scan_epg_source(epg_path, playlist_id_to_title, title_index, spool_path, window=(None, None),
+                    cached_channels=None, cached_maps=None):
+    """
+    单次流式扫描一个 EPG 源（在工作进程中运行），筛选出与播放列表匹配的节目。
+    XMLTV 中 <channel> 位于 <programme> 之前，因此：
+    1. 在 <tv> 的 start 事件读取根节点属性；
+    2. 扫描 <channel>，建立 `epg_id -> [display-name, ...]` 的地图；
+    3. 遇到第一个 <programme> 时，根据播放列表建立 `epg_id -> final_title` 的主映射；
+    4. 继续扫描 <programme>，丢弃时间窗口 window（见 get_epg_window）之外的节目，
+       保留的节目以 (final_title, start, stop, title, start_ts, stop_ts) 逐条 pickle 到 spool_path。
+    少数 <channel> 出现在 <programme> 之后的情况：引用未知频道的节目先暂存到另一个 spool 文件，
+    扫描结束后若这些频道能匹配，再把对应节目追加到 spool_path 末尾。
+
+    cached_channels 为缓存的 (channels, late_channels) 时跳过 <channel> 的处理；
+    cached_maps 为缓存的 (master_map, late_map) 时连映射也不再计算，否则根据缓存的频道列表重新计算。
+
+    返回:
+        (dict, tuple, tuple, int, int, dict): 根节点属性, (channels, late_channels), (master_map, late_map),
+                                              保留的节目数, 因时间窗口丢弃的节目数, 各阶段耗时（秒）
+    """
+    root_attrs = {}
+    matched_names = set()
+    master_map = late_map = None
+    if cached_channels is not None:
+        epg_id_to_name_map, late_channels = cached_channels
+        if cached_maps is not None:
+            master_map, late_map = cached_maps
+        else:
+            master_map, late_map = {}, {}
+            build_master_map(epg_id_to_name_map, playlist_id_to_title, title_index,
+                             master_map, matched_names)
+            build_master_map(late_channels, playlist_id_to_title, title_index, late_map, matched_names)
+    else:
+        epg_id_to_name_map, late_channels = {}, {}
+    scan_channels = cached_channels is None
 
-    except Exception as e:
-        logger.error(f"❌ An error occurred during Pass 1 (EPG scan): {e}")
-        traceback.print_exc()
-        return False
-    logger.info(f"ℹ️ Found {len(epg_id_to_name_map)} channels in the source EPG.")
+    programme_count = 0
+    pending_count = 0
+    pruned_count = 0
+    timings = {}
+    phase_start = time.perf_counter()
+    with open(spool_path, "wb") as kept_spool, tempfile.TemporaryFile() as pending_spool:
+        for event, elem in iter_epg_events(epg_path):
+            if event == "start":
+                if elem.tag == 'tv' and 'date' in elem.attrib:
+                    root_attrs['date'] = elem.get('date')
+                continue
+
+            if elem.tag == 'channel':
+                if not scan_channels:
+                    continue
+                channel_id = elem.get('id')
+                display_names = [node.text for node in elem.iterfind('display-name') if node.text]
+                if channel_id and display_names:
+                    if master_map is None:
+                        epg_id_to_name_map[channel_id] = display_names
+                    elif channel_id not in epg_id_to_name_map:
+                        late_channels[channel_id] = display_names
+
+            elif elem.tag == 'programme':
+                if master_map is None:
+                    # 频道部分结束：建立主映射
+                    timings['channels'] = time.perf_counter() - phase_start
+                    phase_start = time.perf_counter()
+                    master_map = {}
+                    build_master_map(epg_id_to_name_map, playlist_id_to_title, title_index,
+                                     master_map, matched_names)
+                    timings['mapping'] = time.perf_counter() - phase_start
+                    phase_start = time.perf_counter()
+
+                original_channel_id = elem.get('channel')
+                if original_channel_id in master_map:
+                    kept = True
+                elif late_map is not None:
+                    kept = False
+                    if original_channel_id not in late_map:
+                        continue
+                elif original_channel_id not in epg_id_to_name_map:
+                    # 频道尚未出现，可能在后面
+                    kept = False
+                else:
+                    continue
+
+                # 只保留 title 子节点
+                title_node = elem.find('title')
+                start, stop = elem.get('start', ''), elem.get('stop', '')
+                start_ts, stop_ts = parse_xmltv_time(start), parse_xmltv_time(stop)
+                if not in_epg_window(start_ts, stop_ts, window):
+                    pruned_count += 1
+                    continue
+                title = title_node.text if title_node is not None else None
+                if kept:
+                    pickle.dump((master_map[original_channel_id], start, stop, title, start_ts, stop_ts),
+                                kept_spool, protocol=pickle.HIGHEST_PROTOCOL)
+                    programme_count += 1
+                else:
+                    pickle.dump((original_channel_id, start, stop, title, start_ts, stop_ts),
+                                pending_spool, protocol=pickle.HIGHEST_PROTOCOL)
+                    pending_count += 1
+
+        if master_map is None:
+            # 没有任何节目
+            timings['channels'] = time.perf_counter() - phase_start
+            master_map = {}
+            build_master_map(epg_id_to_name_map, playlist_id_to_title, title_index,
+                             master_map, matched_names)
+        timings['programmes'] = time.perf_counter() - phase_start
+
+        # 出现在节目之后的频道
+        if late_map is None:
+            late_map = {}
+            build_master_map(late_channels, playlist_id_to_title, title_index, late_map, matched_names)
+        if late_map and pending_count:
+            for original_channel_id, *programme in _iter_spooled(pending_spool):
+                if original_channel_id in late_map:
+                    pickle.dump((late_map[original_channel_id], *programme), kept_spool,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                    programme_count += 1
+
+    return (root_attrs, (epg_id_to_name_map, late_channels), (master_map, late_map),
+            programme_count, pruned_count, timings)
+
+
+class _ProgrammeTimeline:
+    """
+    记录某个频道已采用节目所占的时间段（合并后的不相交区间，按开始时间排序），
+    用于判断低优先级源的节目是否与已有节目重叠。
+    """
 
-    # --- 建立主映射关系 (epg_id -> final_title) ---
-    logger.info("🗺️  Building master mapping from EPG to playlist...")
-    master_map = {}
-    epg_name_set = set()
+    def __init__(self):
+        self.starts = []
+        self.stops = []
+
+    def overlaps(self, start, stop):
+        index = bisect.bisect_right(self.starts, start)
+        if index and self.stops[index - 1] > start:
+            return True
+        return index < len(self.starts) and self.starts[index] < stop
+
+    def add_all(self, intervals):
+        """批量加入区间并重新合并。"""
+        merged = []
+        for start, stop in sorted(list(zip(self.starts, self.stops)) + intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        self.starts = [start for start, _ in merged]
+        self.stops = [stop for _, stop in merged]
 
-    for epg_id, epg_name in epg_id_to_name_map.items():
-        # 优先策略：通过 tvg-id 匹配
-        if epg_id in valid_playlist_ids:
-            master_map[epg_id] = playlist_id_to_title[epg_id]
-        # 备用策略：通过频道名匹配
-        elif epg_name in valid_playlist_titles and epg_name not in epg_name_set:
-            master_map[epg_id] = epg_name
-            epg_name_set.add(epg_name)
-    if not master_map:
-        logger.warning("⚠️ No matching channels found between playlist and EPG. Aborting.")
-        return False
 
-    logger.info(f"✅ Master mapping created. {len(master_map)} EPG channels will be kept.")
+def open_epg_writers(stack, root_attrs):
+    """
+    打开所有 EPG 输出的临时文件（由 stack 负责关闭），返回 (写入器, [(临时路径, 正式路径), ...])。
 
-    # --- Pass 2: 构建简化的新 EPG ---
-    logger.info("🧹 Pass 2: Cleaning, simplifying, and remapping EPG content...")
-    new_root = ET.Element("tv")
+    FINAL_EPG_PATH 与 EPG_GZIP_PATH / EPG_XZ_PATH 共用同一个缩进写入器，生成的字节经 TeeFile
+    同时写入原始文件和压缩流；EPG_COMPACT_PATH 使用独立的紧凑写入器。
+    """
+    outputs = []
 
-    # 1. 添加 <channel> 节点
-    # 使用 master_map 的值创建唯一的频道列表
-    final_channel_titles = sorted(list(set(master_map.values())))
-    for title in final_channel_titles:
-        new_channel = ET.Element('channel', {'id': title})
-        display_name = ET.SubElement(new_channel, 'display-name')
-        display_name.text = title
-        new_root.append(new_channel)
-    channel_count = len(final_channel_titles)
+    def open_tmp(path):
+        tmp_path = f"{path}.tmp"
+        outputs.append((tmp_path, path))
+        return stack.enter_context(open(tmp_path, "wb"))
 
-    # 2. 添加 <programme> 节点
-    programme_count = 0
+    pretty_files = [open_tmp(FINAL_EPG_PATH)]
+    if EPG_GZIP_PATH:
+        pretty_files.append(stack.enter_context(
+            gzip.GzipFile(filename="", mode="wb", fileobj=open_tmp(EPG_GZIP_PATH), mtime=0)))
+    if EPG_XZ_PATH:
+        pretty_files.append(stack.enter_context(lzma.open(open_tmp(EPG_XZ_PATH), "wb")))
+    pretty_out = pretty_files[0] if len(pretty_files) == 1 else TeeFile(*pretty_files)
 
-    try:
-        for elem in iter_epg_elements(raw_content, 'programme'):
-            original_channel_id = elem.get('channel')
-            # 如果节目对应的频道在主映射中
-            if original_channel_id in master_map:
-                target_title = master_map[original_channel_id]
-
-                # 创建简化的 programme 节点
-                new_attrib = {
-                    'channel': target_title,
-                    'start': elem.get('start', ''),
-                    'stop': elem.get('stop', ''),
-                }
-                new_programme = ET.Element('programme', attrib=new_attrib)
-
-                # 只复制 title 子节点
-                title_node = elem.find('title')
-                if title_node is not None and title_node.text:
-                    ET.SubElement(new_programme, 'title', {'lang': 'eng'}).text = title_node.text
+    writers = [stack.enter_context(XMLTVWriter(pretty_out, root_attrs, indent=EPG_INDENT))]
+    if EPG_COMPACT_PATH:
+        writers.append(stack.enter_context(XMLTVWriter(open_tmp(EPG_COMPACT_PATH), root_attrs, indent=None)))
+    return (writers[0] if len(writers) == 1 else XMLTVWriterGroup(writers)), outputs
 
-                new_root.append(new_programme)
-                programme_count += 1
-            elem.clear()  # 关键！释放内存
-        # 复制根节点的属性
-        for elem in iter_epg_elements(raw_content, 'tv'):
-            if 'date' in elem.attrib:
-                new_root.set('date', elem.get('date'))
-            elem.clear()  # 关键！释放内存
 
+def merge_epg_sources(scan_results, writer, indexed_programmes=None):
+    """
+    按优先级合并各源的扫描结果并写入 writer。
 
-        logger.info(f"ℹ️ Kept {channel_count} channels and {programme_count} programmes (simplified and remapped).")
+    每个频道的节目以第一个提供该频道节目的源为准（全部保留，顺序不变）；
+    后面的源只补充与已采用节目时间不重叠的节目，时间无法解析的节目不予补充。
+    indexed_programmes 为列表时，写入的每个节目还会以 (频道名, 开始时间戳, 结束时间戳, 节目名) 追加到其中，用于生成索引。
 
-        # --- 美化并写入文件 ---
-        rough_string = ET.tostring(new_root, 'utf-8', xml_declaration=True)
-        reparsed = minidom.parseString(rough_string)
-        pretty_xml_as_bytes = reparsed.toprettyxml(indent="  ", encoding='utf-8')
+    返回:
+        int: 写入的节目数
+    """
+    timelines = {}
+    programme_count = 0
+    for source_index, (epg_url, spool_path) in enumerate(scan_results):
+        added = {}
+        source_count = 0
+        with open(spool_path, "rb") as spool:
+            for final_title, start, stop, title, start_ts, stop_ts in _iter_spooled(spool):
+                timeline = timelines.get(final_title)
+                if timeline is not None and (
+                        start_ts is None or stop_ts is None or timeline.overlaps(start_ts, stop_ts)):
+                    continue
+                writer.write_programme(final_title, start, stop, title)
+                source_count += 1
+                if indexed_programmes is not None:
+                    indexed_programmes.append((final_title, start_ts, stop_ts, title))
+                # 时间无法解析的节目不占时间段，但同样使该频道之后的源只能补充
+                intervals = added.setdefault(final_title, [])
+                if start_ts is not None and stop_ts is not None:
+                    intervals.append((start_ts, stop_ts))
+        # 同一个源内部的节目不互相去重，整个源处理完后再并入时间线
+        for final_title, intervals in added.items():
+            timelines.setdefault(final_title, _ProgrammeTimeline()).add_all(intervals)
+        if source_index:
+            logger.info(f"➕ {source_count} programmes added from {epg_url}.")
+        programme_count += source_count
+    return programme_count
+
+
+def clean_and_compress_epg(epg_sources):
+    """
+    【核心重构】并行扫描所有 EPG 源并合并，健壮地筛选并简化 EPG。
+    1. 每个源在独立的工作进程中单次流式扫描（见 scan_epg_source），丢弃时间窗口之外的节目，
+       保留的节目写入各自的 spool 文件；
+    2. 合并所有源的主映射，写入唯一的频道列表；
+    3. 按源的优先级合并节目（见 merge_epg_sources），通过 XMLTVWriter 边读取边写入文件；
+    4. 配置了 EPG_INDEX_PATH 时，另外写入按频道排序的节目索引。
+
+    Args:
+        epg_sources (list): EpgSource 列表，按优先级排序。
+    """
+    playlist_id_to_title, playlist_title_to_id = get_channel_data_from_playlist()
+    if not playlist_id_to_title:
+        logger.warning("⚠️ No valid channel data found. Aborting EPG cleaning.")
+        return False
 
-        with open(FINAL_EPG_PATH, "wb") as f_out:
-            f_out.write(pretty_xml_as_bytes)
+    official_names, _, alias_to_official, _, _ = load_channels_txt(CHANNELS_TXT_PATH)
+    title_index = TitleIndex(playlist_title_to_id.keys(), official_names, alias_to_official)
+    playlist_hash = hash_playlist_channels(playlist_id_to_title, playlist_title_to_id, official_names,
+                                           alias_to_official)
 
-        logger.info(f"✅ EPG cleaning and simplification complete. Saved to {FINAL_EPG_PATH}")
+    outputs = []
+    workers = min(len(epg_sources), EPG_PARSE_WORKERS or os.cpu_count() or 1)
+    window = get_epg_window()
+    logger.info(f"🔍 Scanning {len(epg_sources)} EPG sources in {workers} worker processes "
+                f"({get_epg_parser_backend()} parser)...")
+    try:
+        with tempfile.TemporaryDirectory(prefix="epg-spool-") as spool_dir, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for index, source in enumerate(epg_sources):
+                spool_path = os.path.join(spool_dir, f"{index}.pkl")
+                # 频道映射缓存：源未变化时跳过频道解析，播放列表也未变化时连映射也直接复用
+                cache = None
+                if EPG_CACHE_DIR and source.fingerprint:
+                    cache = load_epg_channel_cache(EPG_CACHE_DIR, source.url, source.fingerprint)
+                cached_channels = (cache["channels"], cache["late_channels"]) if cache else None
+                cached_maps = None
+                if cache and cache["playlist_hash"] == playlist_hash:
+                    cached_maps = (cache["master_map"], cache["late_map"])
+                cache_status = "hit" if cached_maps else "mapping recomputed" if cache else "miss"
+                futures.append((source, spool_path, cache_status, executor.submit(
+                    scan_epg_source, source.path, playlist_id_to_title, title_index, spool_path, window,
+                    cached_channels, cached_maps)))
+
+            root_attrs = None
+            final_channel_titles = set()
+            scan_results = []
+            for source, spool_path, cache_status, future in futures:
+                try:
+                    (source_root_attrs, (channels, late_channels), (master_map, late_map),
+                     programme_count, pruned_count, timings) = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Failed to parse EPG from {source.url}: {e}")
+                    continue
+                phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+                logger.info(f"ℹ️ {source.url}: {len(master_map) + len(late_map)} matching channels, "
+                            f"{programme_count} programmes, {pruned_count} outside the time window "
+                            f"(channel map cache {cache_status}; {phases}).")
+                if EPG_CACHE_DIR and source.fingerprint and cache_status != "hit":
+                    save_epg_channel_cache(EPG_CACHE_DIR, source.url, source.fingerprint, playlist_hash,
+                                           channels, late_channels, master_map, late_map)
+                if root_attrs is None:
+                    root_attrs = source_root_attrs
+                final_channel_titles.update(master_map.values())
+                final_channel_titles.update(late_map.values())
+                scan_results.append((source.url, spool_path))
+
+            if not final_channel_titles:
+                logger.warning("⚠️ No matching channels found between playlist and EPG. Aborting.")
+                return False
+
+            # 频道和节目边读取边写入临时文件，完成后再替换正式文件，避免中途失败留下半个 EPG
+            phase_start = time.perf_counter()
+            with ExitStack() as stack:
+                writer, outputs = open_epg_writers(stack, root_attrs)
+                # 使用所有源主映射的值创建唯一的频道列表
+                final_channel_titles = sorted(final_channel_titles)
+                for title in final_channel_titles:
+                    writer.write_channel(title, title)
+                indexed_programmes = [] if EPG_INDEX_PATH else None
+                programme_count = merge_epg_sources(scan_results, writer, indexed_programmes)
+            logger.info(f"✍️ Merged and wrote the simplified EPG ({time.perf_counter() - phase_start:.2f}s).")
+
+        if EPG_INDEX_PATH:
+            write_programme_index(EPG_INDEX_PATH, build_programme_index(indexed_programmes))
+            logger.info(f"🗂️ Programme index saved to {EPG_INDEX_PATH}.")
+
+        for tmp_path, path in outputs:
+            os.replace(tmp_path, path)
+        logger.info(f"ℹ️ Kept {len(final_channel_titles)} channels and {programme_count} programmes (simplified and remapped).")
+        logger.info(f"✅ EPG cleaning and simplification complete. Saved to {', '.join(path for _, path in outputs)}")
         return True
 
-    except ET.ParseError as e:
-        logger.error(f"❌ Failed to parse XML from EPG file: {e}")
-        return False
     except Exception as e:
         logger.error(f"❌ An unexpected error occurred during EPG cleaning: {e}")
         traceback.print_exc()
         return False
+    finally:
+        for tmp_path, _ in outputs:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
 def main():
     """主执行函数"""
     logger.info("🚀 Starting EPG processing...")
-    raw_content = download_epg()
-    if raw_content is None or raw_content is False:
+    epg_sources = download_epg()
+    if not epg_sources:
         logger.error("❌ EPG download failed or returned invalid content. Cannot proceed.")
         sys.exit(1)
 
     try:
-        if not clean_and_compress_epg(raw_content):
+        if not clean_and_compress_epg(epg_sources):
             logger.error("❌ EPG processing failed. Please check the logs above.")
             sys.exit(1)
     except (OSError, UnicodeDecodeError, gzip.BadGzipFile, ET.ParseError) as e:
         logger.error(f"❌ EPG processing failed: {e}")
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        for source in epg_sources:
+            os.remove(source.path)
 
     logger.info(f"✅ EPG processing finished. Final EPG saved to {FINAL_EPG_PATH}.")
 
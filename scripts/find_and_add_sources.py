@@ -183,7 +183,7 @@ def get_m3u_urls_from_repo(repo_full_name):
     return m3u_urls
 
 
-def check_source_channels(source_url, official_names, official_to_aliases, alias_to_official):
+def check_source_channels(source_url, official_names, official_to_aliases, alias_to_official, alias_matcher=None):
     """
     检查 M3U 源中是否包含 channels.txt 中的频道。
     
@@ -213,7 +213,7 @@ def check_source_channels(source_url, official_names, official_to_aliases, alias
                 norm_title = normalize_title_for_match(title)
                 
                 # 检查是否匹配 channels.txt 中的频道
-                is_match, official_name = get_official_name(title, official_names, official_to_aliases, alias_to_official)
+                is_match, official_name = get_official_name(title, official_names, official_to_aliases, alias_to_official, alias_matcher)
                 if is_match:
                     if official_name not in matched_channels:
                         matched_channels.append(official_name)
@@ -269,7 +269,8 @@ def main():
     logger.info(f"运行时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     # 加载 channels.txt
-    official_names, official_to_aliases, alias_to_official, official_lower_to_original = load_channels_txt(CHANNELS_TXT_PATH)
+    (official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+     alias_matcher) = load_channels_txt(CHANNELS_TXT_PATH)
     logger.info(f"✅ 已加载 {len(official_names)} 个正式频道和 {len(alias_to_official)} 个别名。")
     
     new_sources_added = 0
@@ -296,7 +297,7 @@ def main():
                 continue
                 
             logger.info(f"\n  🔍 验证源：{source_url}")
-            match_count, matched_channels = check_source_channels(source_url, official_names, official_to_aliases, alias_to_official)
+            match_count, matched_channels = check_source_channels(source_url, official_names, official_to_aliases, alias_to_official, alias_matcher)
             
             if match_count > 0:
                 logger.info(f"    ✅ 匹配到 {match_count} 个频道：{', '.join(matched_channels[:10])}{'...' if match_count > 10 else ''}")
@@ -0,0 +1,59 @@
+# tests/test_epg_merge.py
+import pickle
+
+from scripts.epg_getcher import merge_epg_sources
+from utils.xmltv import parse_xmltv_time
+
+
+class _CollectingWriter:
+    def __init__(self):
+        self.programmes = []
+
+    def write_programme(self, channel, start, stop, title=None):
+        self.programmes.append((channel, start, stop, title))
+
+
+def _spool(path, programmes):
+    with open(path, "wb") as f:
+        for channel, start, stop, title in programmes:
+            pickle.dump((channel, start, stop, title, parse_xmltv_time(start), parse_xmltv_time(stop)), f)
+    return str(path)
+
+
+def _merge(tmp_path, *sources):
+    writer = _CollectingWriter()
+    indexed = []
+    scan_results = [(f"http://epg{index}.example/", _spool(tmp_path / f"{index}.spool", programmes))
+                    for index, programmes in enumerate(sources)]
+    count = merge_epg_sources(scan_results, writer, indexed)
+    assert count == len(writer.programmes) == len(indexed)
+    return writer.programmes
+
+
+def test_first_source_wins_and_second_only_fills_gaps(tmp_path):
+    first = [
+        ("CCTV1", "20240101120000 +0000", "20240101130000 +0000", "A"),
+        # 同一个源内部的重叠节目全部保留
+        ("CCTV1", "20240101123000 +0000", "20240101133000 +0000", "A overlap"),
+        ("CCTV1", "20240101150000 +0000", "20240101160000 +0000", "C"),
+    ]
+    second = [
+        ("CCTV1", "20240101110000 +0000", "20240101120000 +0000", "before"),      # 紧接着，不重叠
+        ("CCTV1", "20240101125959 +0000", "20240101140000 +0000", "overlaps A"),
+        ("CCTV1", "20240101133000 +0000", "20240101150000 +0000", "gap"),          # 恰好填满空档
+        ("CCTV1", "20240101155900 +0000", "20240101170000 +0000", "overlaps C"),
+        ("CCTV1", "garbage", "20240101190000 +0000", "bad start"),
+        ("CCTV1", "20240101200000 +0000", "", "no stop"),
+        ("CCTV2", "20240101120000 +0000", "20240101130000 +0000", "new channel"),
+        ("CCTV2", "20240101123000 +0000", "20240101133000 +0000", "new channel overlap"),
+    ]
+    titles = [title for _, _, _, title in _merge(tmp_path, first, second)]
+    assert titles == ["A", "A overlap", "C", "before", "gap", "new channel", "new channel overlap"]
+
+
+def test_unparseable_times_are_kept_only_from_the_first_source(tmp_path):
+    first = [("CCTV1", "bad", "bad", "first bad"), ("CCTV1", "20240101120000 +0000", "20240101130000 +0000", "A")]
+    second = [("CCTV1", "bad", "bad", "second bad"), ("CCTV2", "bad", "", "only source")]
+    third = [("CCTV2", "bad", "", "third bad"), ("CCTV2", "20240101120000 +0000", "20240101130000 +0000", "fill")]
+    titles = [title for _, _, _, title in _merge(tmp_path, first, second, third)]
+    assert titles == ["first bad", "A", "only source", "fill"]
@@ -0,0 +1,79 @@
+# tests/test_health_store.py
+import pytest
+
+from utils.health_store import HealthStore, backoff_interval, OK_BASE_INTERVAL, FAIL_BASE_INTERVAL, STALE_DAYS
+from utils.stream_check import ProbeResult
+
+URL = "http://a.example/live.m3u8"
+OK = ProbeResult(True, 0.2)
+FAIL = ProbeResult(False, reason="timeout")
+T0 = 1_700_000_000.0
+HOUR = 3600
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    with HealthStore(str(tmp_path / "health.sqlite")) as store:
+        yield store
+
+
+def _next_check(store, url=URL):
+    return store._conn.execute("SELECT next_check FROM streams WHERE url = ?", (url,)).fetchone()[0]
+
+
+def _record_sequence(store, results):
+    """按 results 的顺序在每次到期时记录结果，返回各次记录后的检查间隔。"""
+    now = T0
+    intervals = []
+    for result in results:
+        store.record_results([(URL, result)], now=now)
+        intervals.append(_next_check(store) - now)
+        now = _next_check(store)
+    return intervals
+
+
+def test_backoff_interval_doubles_up_to_the_cap():
+    assert [backoff_interval(10, 50, streak) for streak in range(0, 6)] == [10, 10, 20, 40, 50, 50]
+
+
+def test_ok_backoff_sequence_and_cap(store):
+    assert _record_sequence(store, [OK] * 6) == [6 * HOUR, 12 * HOUR, 24 * HOUR, 48 * HOUR, 72 * HOUR, 72 * HOUR]
+
+
+def test_fail_backoff_sequence_and_cap(store):
+    assert _record_sequence(store, [FAIL] * 7) == [
+        12 * HOUR, 24 * HOUR, 48 * HOUR, 96 * HOUR, 192 * HOUR, 14 * DAY, 14 * DAY
+    ]
+
+
+def test_status_flip_resets_the_streak(store):
+    assert _record_sequence(store, [OK, OK, OK, FAIL, FAIL, OK]) == [
+        6 * HOUR, 12 * HOUR, 24 * HOUR, 12 * HOUR, 24 * HOUR, 6 * HOUR
+    ]
+
+
+def test_dead_entries_not_yet_due_are_known_false(store):
+    new_url = "http://b.example/new.m3u8"
+    store.record_results([(URL, FAIL)], now=T0)
+    to_check, known = store.plan_checks([URL, new_url], now=T0 + FAIL_BASE_INTERVAL - 1)
+    assert to_check == [new_url]
+    assert known == {URL: False}
+
+    to_check, known = store.plan_checks([URL, new_url], now=T0 + FAIL_BASE_INTERVAL)
+    assert to_check == [URL, new_url]
+    assert known == {}
+
+
+def test_prune_removes_only_urls_not_seen_recently(store):
+    seen_url, stale_url = "http://a.example/seen", "http://a.example/stale"
+    store.record_results([(seen_url, OK), (stale_url, OK)], now=T0)
+    # seen_url 未到期但仍出现在源中，plan_checks 更新它的 last_seen
+    later = T0 + OK_BASE_INTERVAL - 1
+    store.plan_checks([seen_url], now=later)
+
+    assert store.prune(now=T0 + STALE_DAYS * DAY) == 0
+    assert store.prune(now=later + STALE_DAYS * DAY - 1) == 1
+    assert set(store.load_stream_health()) == {seen_url}
+    assert store.prune(now=later + STALE_DAYS * DAY + 1) == 1
+    assert store.load_stream_health() == {}
@@ -0,0 +1,61 @@
+# tests/test_network.py
+import os
+import threading
+from concurrent.futures import TimeoutError as FuturesTimeoutError, wait
+
+import utils.network as network
+from utils.network import DownloadedSource, fetch_playlists_concurrently
+from utils.source_cache import get_cache_paths, prune_source_cache, save_cache_meta
+
+
+def test_deadline_keeps_downloads_that_finish_during_the_timeout(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    release = threading.Event()
+    cached_url, late_url, missing_url = "http://a.example/cached.m3u", "http://a.example/late.m3u", "http://b.example/x"
+    body_path, _ = get_cache_paths(cache_dir, cached_url)
+    with open(body_path, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+    save_cache_meta(cache_dir, cached_url, {"sha256": "0" * 64, "encoding": "utf-8"})
+
+    def fake_download(url, cache_dir, retries, timeout, deadline):
+        if url == late_url:
+            return DownloadedSource(url, "late.m3u", "1" * 64, "utf-8")
+        release.wait(5)
+        return None
+
+    def fake_as_completed(futures, timeout):
+        # 模拟竞争：late 在 as_completed 最后一次唤醒之后才完成，超时时没有被产出
+        late = next(future for future, url in futures.items() if url == late_url)
+        wait([late])
+        raise FuturesTimeoutError()
+        yield
+
+    monkeypatch.setattr(network, "download_playlist", fake_download)
+    monkeypatch.setattr(network, "as_completed", fake_as_completed)
+    try:
+        results = dict(fetch_playlists_concurrently([cached_url, late_url, missing_url], cache_dir, deadline_seconds=1))
+    finally:
+        release.set()
+
+    assert results[late_url] == DownloadedSource(late_url, "late.m3u", "1" * 64, "utf-8")
+    assert results[cached_url] == DownloadedSource(cached_url, body_path, "0" * 64, "utf-8")
+    assert missing_url not in results
+
+
+def test_prune_source_cache_removes_unlisted_sources(tmp_path):
+    cache_dir = str(tmp_path)
+    listed, dropped = "http://a.example/listed.m3u", "http://a.example/dropped.m3u"
+    for url in (listed, dropped):
+        body_path, _ = get_cache_paths(cache_dir, url)
+        with open(body_path, "w", encoding="utf-8") as f:
+            f.write("#EXTM3U\n")
+        save_cache_meta(cache_dir, url, {"sha256": "0" * 64, "encoding": "utf-8"})
+    dropped_body, _ = get_cache_paths(cache_dir, dropped)
+    open(f"{dropped_body}.tmp", "w").close()
+    (tmp_path / "README").write_text("not a cache file")
+
+    assert prune_source_cache(cache_dir, [listed]) == 3
+    assert sorted(os.listdir(cache_dir)) == sorted(
+        [os.path.basename(path) for path in get_cache_paths(cache_dir, listed)] + ["README"])
+    assert prune_source_cache(cache_dir, [listed]) == 0
+    assert prune_source_cache(None, []) == 0
@@ -0,0 +1,138 @@
+# tests/test_parallel_normalize.py
+"""
+串行处理、进程池（PARSE_WORKERS > 1）和流水线（PIPELINE）三种方式对同一批源的输出必须逐字节一致。
+"""
+import random
+
+import pytest
+
+import mergeclean
+from utils.channel_filter import load_channels_txt
+from utils.network import DownloadedSource
+from utils.playlist_writer import process_and_normalize_channels, merge_normalized_channels, write_merged_playlist
+
+SOURCE_COUNT = 5
+CHANNELS_PER_SOURCE = 400
+CATEGORY_KEY = ["news", "sport"]
+
+CHANNELS_TXT = """\
+# 测试用频道列表
+CCTV1,CCTV-1
+CCTV2,CCTV-2
+凤凰卫视,凤凰中文
+Sports One,SportsOne
+"""
+
+TITLES = ["CCTV1", "CCTV-1 (1080p)", "CCTV-2", "cctv2 [Geo-blocked]", "凤凰中文", "SportsOne HD", "Sports One",
+          "Random TV", "XXX Adult", "Adult News"]
+GROUPS = ["News", "Sports", "Movies", "新闻 News"]
+
+
+def _build_playlist(path, rng):
+    lines = ["#EXTM3U"]
+    for i in range(CHANNELS_PER_SOURCE):
+        title = rng.choice(TITLES)
+        logo = f'tvg-logo="http://logo.example/{rng.randrange(3)}.png" ' if rng.random() < 0.7 else ""
+        lines.append(f'#EXTINF:-1 tvg-id="{title.lower()}" {logo}group-title="{rng.choice(GROUPS)}",{title}')
+        if rng.random() < 0.2:
+            lines.append("#EXTVLCOPT:http-user-agent=Test/1.0")
+        scheme = rng.choice(["http", "https", "http", "rtmp"])
+        stream = rng.randrange(60)
+        query = "?a=1&b=2" if rng.random() < 0.5 else "?b=2&a=1&utm_source=x"
+        lines.append(f"{scheme}://stream{stream % 5}.example/live/{stream}.m3u8{query}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _score(title, url):
+    return (len(title) + len(url)) % 7
+
+
+@pytest.fixture
+def sources(tmp_path):
+    rng = random.Random(20240101)
+    urls = []
+    downloaded = {}
+    for index in range(SOURCE_COUNT):
+        url = f"http://sources.example/{index}.m3u"
+        path = tmp_path / f"{index}.m3u"
+        _build_playlist(path, rng)
+        urls.append(url)
+        downloaded[url] = DownloadedSource(url, str(path), f"{index:064d}", "utf-8")
+    # 缺失的源：下载失败
+    urls.insert(2, "http://sources.example/missing.m3u")
+    return urls, downloaded
+
+
+@pytest.fixture
+def channel_data(tmp_path):
+    channels_txt = tmp_path / "channels.txt"
+    channels_txt.write_text(CHANNELS_TXT, encoding="utf-8")
+    return load_channels_txt(str(channels_txt))
+
+
+@pytest.fixture(params=[True, False], ids=["channels_txt", "no_channels_txt"])
+def normalize_args(request, tmp_path, channel_data, monkeypatch):
+    cache_dir = str(tmp_path / "parsed")
+    monkeypatch.setattr(mergeclean, "PARSE_CACHE_DIR", cache_dir)
+    official_names, official_to_aliases, alias_to_official, official_lower_to_original, alias_matcher = channel_data
+    return (cache_dir, official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+            alias_matcher, request.param, True, CATEGORY_KEY)
+
+
+def _render(tmp_path, name, channels):
+    path = tmp_path / f"{name}.m3u8"
+    write_merged_playlist(channels, "http://epg.example/e.xml", str(path))
+    return path.read_bytes()
+
+
+def _run_serial(urls, downloaded, normalize_args):
+    (_, official_names, official_to_aliases, alias_to_official, official_lower_to_original, alias_matcher,
+     channels_txt_filter, category_filter, category_key) = normalize_args
+    return process_and_normalize_channels(
+        mergeclean.iter_source_channels(urls, downloaded), official_names, official_to_aliases, alias_to_official,
+        official_lower_to_original, mergeclean.is_nsfw, channels_txt_filter, category_filter, category_key,
+        alias_matcher=alias_matcher, stream_scorer=_score, max_streams_per_channel=3
+    )
+
+
+def _run_pool(urls, downloaded, normalize_args, workers):
+    official_names = set()
+    normalized = mergeclean.normalize_sources_in_pool(urls, downloaded, normalize_args, workers, official_names, {})
+    return merge_normalized_channels(normalized, _score, 3), official_names
+
+
+def _run_pipeline(urls, downloaded, normalize_args, workers, tmp_path, monkeypatch):
+    def fake_fetch(fetch_urls, *args, **kwargs):
+        # 按与列表相反的顺序完成下载，检验重排
+        for url in reversed(fetch_urls):
+            yield url, downloaded.get(url)
+
+    monkeypatch.setattr(mergeclean, "fetch_playlists_concurrently", fake_fetch)
+    monkeypatch.setattr(mergeclean, "PARSE_WORKERS", workers)
+    monkeypatch.setattr(mergeclean, "PIPELINE_WINDOW", 2)
+    monkeypatch.setattr(mergeclean, "URL_CHECK", False)
+    monkeypatch.setattr(mergeclean, "MAX_STREAMS_PER_CHANNEL", 3)
+    official_names = set()
+    channels = mergeclean.run_pipeline(urls, str(tmp_path / "sources"), normalize_args, _score, official_names, {})
+    return channels, official_names
+
+
+def test_parallel_paths_match_serial(tmp_path, sources, normalize_args, monkeypatch):
+    urls, downloaded = sources
+    serial_channels, serial_names = _run_serial(urls, downloaded, normalize_args)
+    expected = _render(tmp_path, "serial", serial_channels)
+    assert serial_channels
+
+    pool_channels, pool_names = _run_pool(urls, downloaded, normalize_args, workers=2)
+    assert _render(tmp_path, "pool", pool_channels) == expected
+    assert pool_names == serial_names
+
+    for workers in (1, 2):
+        pipeline_channels, pipeline_names = _run_pipeline(urls, downloaded, normalize_args, workers, tmp_path,
+                                                          monkeypatch)
+        assert _render(tmp_path, f"pipeline{workers}", pipeline_channels) == expected
+        assert pipeline_names == serial_names
+
+    # 第二次运行读取解析缓存，结果不变
+    cached_channels, _ = _run_serial(urls, downloaded, normalize_args)
+    assert _render(tmp_path, "cached", cached_channels) == expected
@@ -0,0 +1,72 @@
+# tests/test_parse_cache.py
+import os
+import pickle
+
+import pytest
+
+from utils import parse_cache
+from utils.m3u_parse import iter_m3u
+from utils.parse_cache import iter_m3u_cached, get_parse_cache_path, PARSE_CACHE_BATCH_SIZE
+
+CHANNEL_COUNT = 12_000
+DIGEST = "0" * 64
+
+
+@pytest.fixture
+def playlist(tmp_path):
+    path = tmp_path / "source.m3u"
+    lines = ["#EXTM3U"]
+    for i in range(CHANNEL_COUNT):
+        lines.append(f'#EXTINF:-1 tvg-id="ch{i}" group-title="G{i % 7}",Channel {i}')
+        lines.append(f"http://example.com/live/{i}.m3u8")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def expected(playlist):
+    with open(playlist, "rb") as f:
+        return list(iter_m3u(f))
+
+
+def _cache_path(tmp_path):
+    return get_parse_cache_path(str(tmp_path / "cache"), DIGEST, "utf-8")
+
+
+def test_cache_round_trip(tmp_path, playlist, expected):
+    cache_dir = str(tmp_path / "cache")
+    assert list(iter_m3u_cached(playlist, DIGEST, cache_dir)) == expected
+    assert os.path.exists(_cache_path(tmp_path))
+    assert list(iter_m3u_cached(playlist, DIGEST, cache_dir)) == expected
+
+
+def test_truncated_cache_is_reparsed(tmp_path, playlist, expected):
+    cache_dir = str(tmp_path / "cache")
+    list(iter_m3u_cached(playlist, DIGEST, cache_dir))
+    cache_path = _cache_path(tmp_path)
+    with open(cache_path, "rb+") as f:
+        f.truncate(os.path.getsize(cache_path) // 2)
+
+    assert list(iter_m3u_cached(playlist, DIGEST, cache_dir)) == expected
+    # 损坏的缓存被重新写入，之后可以正常读取
+    assert list(iter_m3u_cached(playlist, DIGEST, cache_dir)) == expected
+
+
+def test_cache_truncated_at_batch_boundary_is_reparsed(tmp_path, playlist, expected):
+    cache_dir = str(tmp_path / "cache")
+    cache_path = _cache_path(tmp_path)
+    os.makedirs(cache_dir)
+    with open(cache_path, "wb") as f:
+        pickle.dump(expected[:PARSE_CACHE_BATCH_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    assert list(iter_m3u_cached(playlist, DIGEST, cache_dir)) == expected
+
+
+def test_cache_write_failure_is_not_fatal(tmp_path, playlist, expected, monkeypatch):
+    def failing_dump(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(parse_cache.pickle, "dump", failing_dump)
+    cache_dir = str(tmp_path / "cache")
+    assert list(iter_m3u_cached(playlist, DIGEST, cache_dir)) == expected
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,164 @@
+# tests/test_pipeline.py
+import os
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import mergeclean
+from utils.m3u_parse import Channel
+from utils.network import DownloadedSource
+from utils.pipeline import SourceWindow, StageMetrics
+from utils.playlist_writer import merge_normalized_channels
+from utils.stream_check import ProbeResult
+from utils.url_canonical import canonical_url_key
+
+
+def _run_with_timeout(func, timeout=30):
+    """在线程中运行 func，超时视为卡死。"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "pipeline hung"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def test_window_reorders_results():
+    window = SourceWindow(3, 2)
+    window.arrive(2, "c")
+    window.arrive(1, "b")
+    window.arrive(0, None)
+    window.close()
+    assert window.next_ready() == (0, None)
+    window.complete(0, None)
+    assert window.next_ready() == (1, "b")
+    window.complete(1, "B")
+    results = window.results()
+    assert next(results) is None
+    assert next(results) == "B"
+    # 窗口向前移动后才交出下标 2
+    assert window.next_ready() == (2, "c")
+    window.complete(2, "C")
+    assert list(results) == ["C"]
+    assert window.next_ready() is None
+
+
+def test_window_failure_unblocks_waiters():
+    window = SourceWindow(2, 1)
+    window.arrive(0, "a")
+    assert window.next_ready() == (0, "a")
+    error = RuntimeError("worker died")
+    threading.Timer(0.1, window.fail, args=(error,)).start()
+    with pytest.raises(RuntimeError, match="worker died"):
+        _run_with_timeout(lambda: list(window.results()))
+    assert window.next_ready() is None
+
+
+def _crash_worker(source):
+    os._exit(1)
+
+
+def _pipeline_args(tmp_path, monkeypatch, fetch):
+    path = tmp_path / "0.m3u"
+    path.write_text("#EXTM3U\n#EXTINF:-1,CCTV1\nhttp://a.example/1.m3u8\n", encoding="utf-8")
+    downloaded = {f"http://sources.example/{index}.m3u": DownloadedSource(
+        f"http://sources.example/{index}.m3u", str(path), f"{index:064d}", "utf-8") for index in range(4)}
+    monkeypatch.setattr(mergeclean, "fetch_playlists_concurrently", lambda urls, *args: fetch(urls, downloaded))
+    monkeypatch.setattr(mergeclean, "PIPELINE_WINDOW", 2)
+    monkeypatch.setattr(mergeclean, "URL_CHECK", False)
+    normalize_args = (str(tmp_path / "parsed"), set(), {}, {}, {}, None, False, False, [])
+    return lambda: mergeclean.run_pipeline(list(downloaded), str(tmp_path), normalize_args, None, set(), {})
+
+
+def test_pipeline_raises_when_parse_workers_die(tmp_path, monkeypatch):
+    monkeypatch.setattr(mergeclean, "_parse_and_normalize_source", _crash_worker)
+    monkeypatch.setattr(mergeclean, "PARSE_WORKERS", 2)
+    run = _pipeline_args(tmp_path, monkeypatch, lambda urls, downloaded: ((url, downloaded[url]) for url in urls))
+    with pytest.raises(mergeclean.BrokenExecutor):
+        _run_with_timeout(run)
+
+
+def test_pipeline_raises_when_fetch_stage_fails(tmp_path, monkeypatch):
+    def fetch(urls, downloaded):
+        yield urls[0], downloaded[urls[0]]
+        raise OSError("disk full")
+
+    monkeypatch.setattr(mergeclean, "PARSE_WORKERS", 1)
+    run = _pipeline_args(tmp_path, monkeypatch, fetch)
+    with pytest.raises(OSError, match="disk full"):
+        _run_with_timeout(run)
+
+
+class _StubProber:
+    """按地址返回预设结果的探测器，记录探测过的地址。"""
+
+    def __init__(self, results):
+        self.results = results
+        self.probed = []
+
+    def submit(self, channel):
+        self.probed.append(channel[-1])
+        future = Future()
+        future.set_result(self.results[channel[-1]])
+        return future
+
+
+def _probe_then_merge(sources, prober):
+    normalized = mergeclean.probe_normalized_sources(sources, prober, None, 10, StageMetrics("url check"))
+    return [channel.url for channel in merge_normalized_channels(normalized)]
+
+
+def _normalized(title, url):
+    return title, canonical_url_key(url), Channel(title, "", "", "", title, "", url)
+
+
+@pytest.mark.parametrize("https_ok", [True, False])
+def test_https_variant_is_probed_before_it_replaces_http(https_ok):
+    prober = _StubProber({"http://h/1": ProbeResult(True, 0.1), "https://h/1": ProbeResult(https_ok, 0.05)})
+    sources = [[_normalized("A", "http://h/1")], [_normalized("A", "https://h/1"), _normalized("A", "http://h/1")]]
+    assert _probe_then_merge(sources, prober) == ["https://h/1" if https_ok else "http://h/1"]
+    assert prober.probed == ["http://h/1", "https://h/1"]
+
+
+def test_https_variant_survives_a_dead_http_stream():
+    prober = _StubProber({"http://h/1": ProbeResult(False, reason="timeout"), "https://h/1": ProbeResult(True, 0.05)})
+    sources = [[_normalized("A", "http://h/1"), _normalized("A", "https://h/1")]]
+    assert _probe_then_merge(sources, prober) == ["https://h/1"]
+
+
+def test_pipeline_ranks_streams_with_this_runs_latency(monkeypatch):
+    monkeypatch.setattr(mergeclean, "HEALTH_DB_PATH", None)
+    prober = _StubProber({"http://slow.example/a": ProbeResult(True, 1.9), "http://fast.example/a": ProbeResult(True, 0.05)})
+    probe_health = {}
+    scorer = mergeclean.load_stream_scorer(probe_health)
+    sources = [[_normalized("A", "http://slow.example/a")], [_normalized("A", "http://fast.example/a")]]
+    normalized = mergeclean.probe_normalized_sources(sources, prober, None, 10, StageMetrics("url check"),
+                                                     probe_health)
+    merged = merge_normalized_channels(normalized, scorer, 1)
+    assert [channel.url for channel in merged] == ["http://fast.example/a"]
+
+
+def test_staged_check_ranks_streams_with_this_runs_latency(monkeypatch):
+    latencies = {"http://slow.example/a?x=1": 1.9, "http://fast.example/a": 0.05}
+    monkeypatch.setattr(mergeclean, "HEALTH_DB_PATH", None)
+    monkeypatch.setattr(mergeclean, "check_urls",
+                        lambda channels, *args: [ProbeResult(True, latencies[channel[-1]]) for channel in channels])
+    channels = [Channel("A", "", "", "", "A", "", url)
+                for url in ("http://slow.example/a?x=1", "http://slow.example/a?x=1&utm_source=y",
+                            "http://fast.example/a")]
+    probe_health = {}
+    accessible = mergeclean.check_urls_concurrently(channels, probe_health)
+    assert probe_health["http://slow.example/a?x=1&utm_source=y"] == (True, 1.9)
+    scorer = mergeclean.load_stream_scorer(probe_health)
+    normalized = (("A", canonical_url_key(channel.url), channel) for channel in accessible)
+    assert [channel.url for channel in merge_normalized_channels(normalized, scorer, 1)] == ["http://fast.example/a"]
@@ -0,0 +1,46 @@
+# tests/test_playlist_writer.py
+from utils.m3u_parse import Channel
+from utils.playlist_writer import merge_normalized_channels
+from utils.url_canonical import canonical_url_key
+
+
+def _normalized(title, url, group="News"):
+    channel = Channel(title, None, None, group, title, (), url)
+    return title, canonical_url_key(url), channel
+
+
+def test_https_variant_replaces_earlier_http_variant():
+    final = merge_normalized_channels([
+        _normalized("CCTV1", "http://h.com/live/1.m3u8"),
+        _normalized("CCTV2", "http://h.com/live/2.m3u8"),
+        _normalized("CCTV1", "https://h.com/live/1.m3u8"),
+    ])
+    assert [channel.url for channel in final] == ["https://h.com/live/1.m3u8", "http://h.com/live/2.m3u8"]
+
+
+def test_first_https_variant_is_kept():
+    final = merge_normalized_channels([
+        _normalized("CCTV1", "https://h.com/live/1.m3u8"),
+        _normalized("CCTV1", "http://h.com/live/1.m3u8"),
+    ])
+    assert [channel.url for channel in final] == ["https://h.com/live/1.m3u8"]
+
+
+def test_rtmp_variant_is_not_merged_with_http():
+    final = merge_normalized_channels([
+        _normalized("CCTV1", "http://h.com/live/1"),
+        _normalized("CCTV1", "rtmp://h.com/live/1"),
+    ])
+    assert len(final) == 2
+
+
+def test_https_variant_is_rescored():
+    def scorer(title, url):
+        return 1 if url.startswith("https") else 0
+
+    final = merge_normalized_channels([
+        _normalized("CCTV1", "http://a.com/1"),
+        _normalized("CCTV1", "http://b.com/1"),
+        _normalized("CCTV1", "https://b.com/1"),
+    ], stream_scorer=scorer, max_streams_per_channel=1)
+    assert [channel.url for channel in final] == ["https://b.com/1"]
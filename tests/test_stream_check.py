@@ -0,0 +1,60 @@
+# tests/test_stream_check.py
+import asyncio
+
+import aiohttp
+
+from utils.stream_check import BackgroundProber, ProbeResult, _is_hls_playlist, _looks_like_media, _probe_one
+
+
+def test_hls_playlist_detection():
+    assert _is_hls_playlist(b"#EXTM3U\n#EXT-X-VERSION:3\n")
+    assert _is_hls_playlist(b"\xef\xbb\xbf\r\n#EXTM3U\n")
+    assert not _is_hls_playlist(b"<html></html>")
+
+
+def test_media_signatures():
+    assert _looks_like_media(b"\x47" + b"\x00" * 187 + b"\x47" + b"\x00" * 10, "")
+    assert _looks_like_media(b"FLV\x01\x05", "")
+    assert _looks_like_media(b"ID3\x04\x00", "")
+    assert _looks_like_media(b"\x00\x00\x00\x18ftypmp42", "")
+
+
+def test_media_content_types():
+    assert _looks_like_media(b"{}", "video/mp2t")
+    assert _looks_like_media(b"abc", "application/octet-stream; charset=binary")
+
+
+def test_error_bodies_are_not_media():
+    assert not _looks_like_media(b'{"error": "stream offline"}', "application/json")
+    assert not _looks_like_media(b"Forbidden", "text/plain")
+    assert not _looks_like_media(b"<html><body>404</body></html>", "text/html")
+    assert not _looks_like_media(b"G" + b"x" * 300, "")
+    assert not _looks_like_media(b"", "video/mp2t")
+
+
+async def _broken_probe(session, limiter, url, headers):
+    raise KeyError("location")
+
+
+async def _slow_probe(session, limiter, url, headers):
+    await asyncio.sleep(10)
+
+
+async def _refused_probe(session, limiter, url, headers):
+    raise aiohttp.ClientConnectionError()
+
+
+def test_probe_one_turns_errors_into_results():
+    def run(probe, timeout=5):
+        return asyncio.run(_probe_one(None, None, probe, "http://a.example/", {}, timeout))
+
+    assert run(_broken_probe) == ProbeResult(False, reason="KeyError: 'location'")
+    assert run(_slow_probe, timeout=0.05) == ProbeResult(False, reason="timeout")
+    assert run(_refused_probe) == ProbeResult(False, reason="ClientConnectionError")
+
+
+def test_background_prober_survives_unexpected_errors():
+    with BackgroundProber() as prober:
+        prober._probe = _broken_probe
+        result = prober.submit(("", "", "http://a.example/live.m3u8")).result(timeout=5)
+    assert result == ProbeResult(False, reason="KeyError: 'location'")
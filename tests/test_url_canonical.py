@@ -0,0 +1,19 @@
+# tests/test_url_canonical.py
+from utils.url_canonical import canonical_url_key
+
+
+def test_http_and_https_share_a_key():
+    assert canonical_url_key("http://H.com/live/x/") == canonical_url_key("https://h.com:443/live/x")
+    assert canonical_url_key("http://h.com/live/x?b=2&a=1&utm_source=t") == canonical_url_key("http://h.com/live/x?a=1&b=2")
+
+
+def test_other_schemes_keep_their_scheme():
+    keys = {
+        canonical_url_key("rtmp://h.com/live/x"),
+        canonical_url_key("http://h.com/live/x"),
+        canonical_url_key("rtsp://h.com:554/live/x"),
+        canonical_url_key("http://h.com:554/live/x"),
+    }
+    assert len(keys) == 4
+    assert canonical_url_key("rtsp://h.com:554/live/x") == canonical_url_key("rtsp://h.com/live/x")
+    assert canonical_url_key("RTMP://h.com:1935/live/x") == canonical_url_key("rtmp://h.com/live/x")
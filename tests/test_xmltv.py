@@ -0,0 +1,72 @@
+# tests/test_xmltv.py
+import io
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+import pytest
+
+from utils.xmltv import XMLTVWriter, parse_xmltv_time
+
+CHANNELS = ["CCTV1", "A&E", "<Kids>", 'Say "Hi"', "凤凰卫视中文台", "Tom & Jerry's <TV>"]
+PROGRAMMES = [
+    ("CCTV1", "20240101120000 +0800", "20240101130000 +0800", "新闻联播"),
+    ("A&E", "20240101120000 +0000", "20240101130000 +0000", "Fish & Chips <Live>"),
+    ("<Kids>", "20240101120000 +0000", "20240101123000 +0000", 'The "Show" > all'),
+    ("凤凰卫视中文台", "20240101120000 +0800", "20240101130000 +0800", ""),
+    ('Say "Hi"', "20240101120000 +0000", "20240101130000 +0000", None),
+]
+
+
+def render_minidom(root_attrs, channels, programmes):
+    """原先的输出方式：构建 ElementTree，再用 minidom 美化。"""
+    root = ET.Element("tv")
+    for title in channels:
+        channel = ET.Element("channel", {"id": title})
+        ET.SubElement(channel, "display-name").text = title
+        root.append(channel)
+    for channel, start, stop, title in programmes:
+        programme = ET.Element("programme", attrib={"channel": channel, "start": start, "stop": stop})
+        if title:
+            ET.SubElement(programme, "title", {"lang": "eng"}).text = title
+        root.append(programme)
+    for name, value in root_attrs.items():
+        root.set(name, value)
+    rough_string = ET.tostring(root, "utf-8", xml_declaration=True)
+    return minidom.parseString(rough_string).toprettyxml(indent="  ", encoding="utf-8")
+
+
+def render_writer(root_attrs, channels, programmes):
+    out = io.BytesIO()
+    with XMLTVWriter(out, root_attrs) as writer:
+        for title in channels:
+            writer.write_channel(title, title)
+        for programme in programmes:
+            writer.write_programme(*programme)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("root_attrs, channels, programmes", [
+    ({"date": "20240101"}, CHANNELS, PROGRAMMES),
+    ({}, CHANNELS, []),
+    ({"date": "20240101"}, [], []),
+    ({}, [], []),
+])
+def test_writer_matches_minidom(root_attrs, channels, programmes):
+    assert render_writer(root_attrs, channels, programmes) == render_minidom(root_attrs, channels, programmes)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("20240101123000 +0800", 1704083400),
+    ("20240101123000", 1704112200),
+    ("20240101123000 -0130", 1704117600),
+    ("202401011230 +0800", 1704083400),
+    ("202401011230", 1704112200),
+    ("202401011230+0800", 1704083400),
+])
+def test_parse_xmltv_time(value, expected):
+    assert parse_xmltv_time(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", None, "2024", "20240101123000 0800", "not a time"])
+def test_parse_xmltv_time_invalid(value):
+    assert parse_xmltv_time(value) is None
@@ -1,16 +1,22 @@
 # utils/channel_filter.py
 import os
 import re
+from collections import deque
+from functools import lru_cache
+
+# 标题规范化和匹配结果缓存的最大条目数；同一标题在多个源中重复出现时只需计算一次
+TITLE_CACHE_SIZE = 200_000
 
 def load_channels_txt(filepath):
     """
-    解析 channels.txt 文件，提取正式名和别名。
+    解析 channels.txt 文件，提取正式名和别名，并预编译别名匹配器。
     
     返回:
         official_names (set): 包含所有正式名的小写集合
         official_to_aliases (dict): 正式名(小写) -> [别名1(小写), 别名2(小写), ...]
         alias_to_official (dict): 别名(小写) -> 正式名(小写)
         official_lower_to_original (dict): 正式名(小写) -> 正式名(原始字符串)
+        alias_matcher (AliasMatcher): 预编译的别名部分匹配器，传给 get_official_name 使用
     """
     official_names = set()
     official_to_aliases = {}
@@ -19,7 +25,8 @@ def load_channels_txt(filepath):
     
     if not os.path.exists(filepath):
         print(f"⚠️ channels.txt not found at {filepath}")
-        return official_names, official_to_aliases, alias_to_official, official_lower_to_original
+        return (official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+                AliasMatcher(official_to_aliases))
         
     with open(filepath, 'r', encoding='utf-8') as f:
         for line in f:
@@ -43,9 +50,124 @@ def load_channels_txt(filepath):
                     official_to_aliases[official_lower].append(alias_lower)
                     alias_to_official[alias_lower] = official_lower
             
-    return official_names, official_to_aliases, alias_to_official, official_lower_to_original
+    return (official_names, official_to_aliases, alias_to_official, official_lower_to_original,
+            AliasMatcher(official_to_aliases))
+
+
+def _is_meaningful_alias(alias):
+    """别名部分匹配的门槛：长度至少为3，或包含数字（避免 'tv' 匹配所有包含 'tv' 的频道）。"""
+    return len(alias) >= 3 or re.search(r'\d', alias) is not None
+
+
+class AliasMatcher:
+    """
+    预编译的别名部分匹配器，用于替代 get_official_name 中 O(正式名 × 别名) 的逐个扫描。
+
+    逐个扫描返回的是按 official_to_aliases 顺序第一个满足
+    "alias in norm_title 或 norm_title in alias" 的别名对应的正式名。这里给每个有效别名一个顺序号，
+    用两个索引找出满足条件的最小顺序号，结果与逐个扫描完全一致：
+    - alias in norm_title：所有别名构建一个 Aho-Corasick 自动机，一次扫描标题即可找出其中出现的全部别名；
+    - norm_title in alias：预先把每个别名的全部子串放进字典，一次哈希查找即可。
+    每次查找的开销只与标题长度有关，与频道列表大小无关。
+
+    匹配器同时保存一个按原始标题索引的有界结果缓存，供 get_official_name 复用 (is_match, official) 结果。
+    """
+
+    def __init__(self, official_to_aliases, memo_size=TITLE_CACHE_SIZE):
+        self._memo = {}
+        self._memo_size = memo_size
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self._officials = []
+        # Aho-Corasick 自动机：_goto[节点][字符] -> 节点，_best[节点] 为经该节点（含失败链）可匹配的最小顺序号
+        self._goto = [{}]
+        self._best = [None]
+        self._substring_best = {}
+
+        for official, aliases in official_to_aliases.items():
+            for alias in aliases:
+                if not _is_meaningful_alias(alias):
+                    continue
+                order = len(self._officials)
+                self._officials.append(official)
+                self._add_pattern(alias, order)
+                for start in range(len(alias)):
+                    for end in range(start + 1, len(alias) + 1):
+                        self._substring_best.setdefault(alias[start:end], order)
+                self._substring_best.setdefault('', order)
+
+        self._build_failure_links()
+
+    def _add_pattern(self, alias, order):
+        node = 0
+        for char in alias:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._best.append(None)
+            node = next_node
+        if self._best[node] is None:
+            self._best[node] = order
+
+    def _build_failure_links(self):
+        """按层遍历建立失败链接，并把失败链上的最小顺序号合并到每个节点。"""
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                child_fail = self._goto[fail].get(char, 0)
+                self._fail[child] = child_fail if child_fail != child else 0
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+                queue.append(child)
+
+    def get_cached(self, title):
+        """返回缓存的 (is_match, official) 结果，未命中时返回 None。"""
+        result = self._memo.get(title)
+        if result is None:
+            self.memo_misses += 1
+        else:
+            self.memo_hits += 1
+        return result
+
+    def cache_result(self, title, result):
+        """缓存匹配结果；超过上限时淘汰最早写入的条目。"""
+        if len(self._memo) >= self._memo_size:
+            del self._memo[next(iter(self._memo))]
+        self._memo[title] = result
+
+    def match(self, norm_title):
+        """
+        返回与规范化标题部分匹配的正式名（小写），没有匹配时返回 None。
+        """
+        best = self._substring_best.get(norm_title)
+        goto, fail, best_at = self._goto, self._fail, self._best
+        node = 0
+        for char in norm_title:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = best_at[node]
+            if found is not None and (best is None or found < best):
+                best = found
+        return self._officials[best] if best is not None else None
+
+
+_BRACKETS_PATTERN = re.compile(r'\s*\([^)]*\)')
+_SQUARE_BRACKETS_PATTERN = re.compile(r'\s*\[[^\]]*\]')
+_QUALITY_PATTERN = re.compile(r'\b(?:1080p|720p|576i|4k|hd|sd|uhd)\b', re.IGNORECASE)
+_GEO_BLOCKED_PATTERN = re.compile(r'\[Geo-blocked\]', re.IGNORECASE)
+_NOT_24_7_PATTERN = re.compile(r'\[Not 24/7\]', re.IGNORECASE)
 
 
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
 def normalize_title_for_match(title):
     """
     规范化频道标题用于匹配：
@@ -53,28 +175,44 @@ def normalize_title_for_match(title):
     - 移除分辨率标识如 1080p, 720p, HD, SD, 576i 等
     - 移除 Geo-blocked 标识
     - 移除 Not 24/7 等标识
+
+    结果按原始标题缓存（有上限），重复出现的标题只计算一次。
     """
-    canonical_title = re.sub(r'\s*\([^)]*\)', '', title)  # 移除 (xxx)
-    canonical_title = re.sub(r'\s*\[[^\]]*\]', '', canonical_title)  # 移除 [xxx]
+    canonical_title = _BRACKETS_PATTERN.sub('', title)  # 移除 (xxx)
+    canonical_title = _SQUARE_BRACKETS_PATTERN.sub('', canonical_title)  # 移除 [xxx]
     # 移除分辨率标识
-    canonical_title = re.sub(r'\b(?:1080p|720p|576i|4k|hd|sd|uhd)\b', '', canonical_title, flags=re.IGNORECASE)
+    canonical_title = _QUALITY_PATTERN.sub('', canonical_title)
     # 移除 Geo-blocked
-    canonical_title = re.sub(r'\[Geo-blocked\]', '', canonical_title, flags=re.IGNORECASE)
+    canonical_title = _GEO_BLOCKED_PATTERN.sub('', canonical_title)
     # 移除 Not 24/7 等标识
-    canonical_title = re.sub(r'\[Not 24/7\]', '', canonical_title, flags=re.IGNORECASE)
+    canonical_title = _NOT_24_7_PATTERN.sub('', canonical_title)
     canonical_title = canonical_title.strip()
     return canonical_title.lower()
 
 
-def get_official_name(title, official_names, official_to_aliases, alias_to_official):
+def get_official_name(title, official_names, official_to_aliases, alias_to_official, alias_matcher=None):
     """
     根据频道标题获取对应的正式名。
     
+    alias_matcher 为 load_channels_txt 返回的预编译匹配器；提供时用它代替逐个扫描别名，结果相同，
+    并按原始标题缓存匹配结果。
+    
     返回:
         (is_match, official_name_lower)
         is_match: 是否匹配
         official_name_lower: 正式名（小写）
     """
+    if alias_matcher is not None:
+        result = alias_matcher.get_cached(title)
+        if result is None:
+            result = _match_official_name(title, official_names, official_to_aliases, alias_to_official, alias_matcher)
+            alias_matcher.cache_result(title, result)
+        return result
+    return _match_official_name(title, official_names, official_to_aliases, alias_to_official, None)
+
+
+def _match_official_name(title, official_names, official_to_aliases, alias_to_official, alias_matcher):
+    """get_official_name 的实际匹配逻辑（不经过结果缓存）。"""
     norm_title = normalize_title_for_match(title)
     
     # 1. 直接匹配正式名
@@ -86,6 +224,10 @@ def get_official_name(title, official_names, official_to_aliases, alias_to_offic
         return True, alias_to_official[norm_title]
     
     # 3. 检查规范化标题是否匹配某个正式名或别名（精确匹配或别名列表中的项）
+    if alias_matcher is not None:
+        official = alias_matcher.match(norm_title)
+        return (True, official) if official is not None else (False, None)
+
     for official, aliases in official_to_aliases.items():
         # 检查是否匹配正式名
         if norm_title == official:
@@ -107,6 +249,66 @@ def get_official_name(title, official_names, official_to_aliases, alias_to_offic
     return False, None
 
 
+class TitleIndex:
+    """
+    一组频道标题（例如播放列表中的标题）的哈希索引，用于把外部数据中的频道名（例如 EPG 的 display-name）映射回这些标题。
+
+    每个标题按 match_key 归一：规范化（见 normalize_title_for_match）后，若是 channels.txt 中的正式名或别名，
+    则取其正式名。查找时先精确匹配原始标题，再按归一后的键查找，都只是字典查找，开销与标题数量无关。
+    不做别名的部分匹配，避免 'cctv-1' 这类名称误匹配到 'cctv-10'。
+    同一个键对应多个标题时取第一个；规范化后为空的名称（例如只有 "HD"）不参与匹配。
+    """
+
+    def __init__(self, titles, official_names=frozenset(), alias_to_official=None):
+        self._official_names = official_names
+        self._alias_to_official = alias_to_official or {}
+        self._titles = set()
+        self._by_key = {}
+        for title in titles:
+            self._titles.add(title)
+            key = self.match_key(title)
+            if key:
+                self._by_key.setdefault(key, title)
+
+    def match_key(self, name):
+        norm_name = normalize_title_for_match(name)
+        if norm_name in self._official_names:
+            return norm_name
+        return self._alias_to_official.get(norm_name, norm_name)
+
+    def lookup(self, names):
+        """
+        依次用 names 中的每个名称查找对应的标题：先对全部名称做精确匹配，再按归一后的键匹配。
+
+        返回:
+            str 或 None: 匹配到的标题
+        """
+        for name in names:
+            if name in self._titles:
+                return name
+        for name in names:
+            title = self._by_key.get(self.match_key(name))
+            if title is not None:
+                return title
+        return None
+
+
+def get_title_cache_stats(alias_matcher=None):
+    """
+    返回标题缓存的命中统计。
+
+    返回:
+        dict: {'normalize_hits', 'normalize_misses', 'match_hits', 'match_misses'}
+    """
+    normalize_info = normalize_title_for_match.cache_info()
+    return {
+        'normalize_hits': normalize_info.hits,
+        'normalize_misses': normalize_info.misses,
+        'match_hits': alias_matcher.memo_hits if alias_matcher is not None else 0,
+        'match_misses': alias_matcher.memo_misses if alias_matcher is not None else 0,
+    }
+
+
 def get_missing_channels(processed_official_names, official_names):
     """
     找出 official_names 中未在 processed_official_names 中出现的正式名。
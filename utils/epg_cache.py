@@ -0,0 +1,70 @@
+# utils/epg_cache.py
+"""
+EPG 频道映射缓存。
+
+每个 EPG 源保存一份 JSON（文件名为 URL 的 sha1），内容为：
+    fingerprint     源的指纹（ETag、大小和正文 sha256），任一变化即视为频道列表可能变化
+    version         缓存格式版本，与 EPG_CACHE_VERSION 不一致的缓存直接丢弃
+    channels        <programme> 之前出现的 epg_id -> [display-name, ...]
+    late_channels   <programme> 之后才出现的 epg_id -> [display-name, ...]
+    playlist_hash   计算映射时播放列表频道集合（以及 channels.txt）的哈希
+    master_map      channels 对应的 epg_id -> final_title
+    late_map        late_channels 对应的 epg_id -> final_title
+源和播放列表都未变化时直接使用缓存的映射；只有播放列表变化时用缓存的频道列表重新计算映射。
+"""
+import os
+import json
+import hashlib
+
+# 缓存格式版本；缓存内容的结构变化时递增
+EPG_CACHE_VERSION = 2
+
+
+def build_source_fingerprint(etag, size, digest):
+    return f"{etag or ''}|{size}|{digest}"
+
+
+def hash_playlist_channels(playlist_id_to_title, playlist_title_to_id, official_names=(), alias_to_official=None):
+    """播放列表中参与 EPG 匹配的 tvg-id / title 集合，以及 channels.txt 正式名和别名的哈希。"""
+    payload = json.dumps(
+        [sorted(playlist_id_to_title.items()), sorted(playlist_title_to_id.items(), key=lambda item: item[0]),
+         sorted(official_names), sorted((alias_to_official or {}).items())],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_epg_cache_path(cache_dir, url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def load_epg_channel_cache(cache_dir, url, fingerprint):
+    """读取缓存；不存在、无法读取、版本或指纹不一致时返回 None。"""
+    try:
+        with open(get_epg_cache_path(cache_dir, url), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cache.get("version") != EPG_CACHE_VERSION or cache.get("fingerprint") != fingerprint:
+        return None
+    return cache
+
+
+def save_epg_channel_cache(cache_dir, url, fingerprint, playlist_hash, channels, late_channels, master_map, late_map):
+    """保存缓存，先写临时文件再替换。"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = get_epg_cache_path(cache_dir, url)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": EPG_CACHE_VERSION,
+            "url": url,
+            "fingerprint": fingerprint,
+            "channels": channels,
+            "late_channels": late_channels,
+            "playlist_hash": playlist_hash,
+            "master_map": master_map,
+            "late_map": late_map,
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
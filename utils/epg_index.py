@@ -0,0 +1,69 @@
+# utils/epg_index.py
+"""
+按频道预先排序的节目索引（JSON），用于快速查询 "某个频道现在在播什么"。
+
+索引格式：
+    {
+        "generated": <生成时间, Unix 秒>,
+        "channels": {
+            "<频道名>": {"starts": [...], "stops": [...], "titles": [...]},
+            ...
+        }
+    }
+每个频道的节目按开始时间排序，查询时对 starts 二分查找，无需扫描整个 EPG 文件。
+"""
+import os
+import json
+import time
+import bisect
+
+
+def build_programme_index(programmes):
+    """
+    根据 (频道名, 开始时间戳, 结束时间戳, 节目名) 构建索引字典；时间无法解析的节目不进入索引。
+    """
+    by_channel = {}
+    for channel, start_ts, stop_ts, title in programmes:
+        if start_ts is None or stop_ts is None:
+            continue
+        by_channel.setdefault(channel, []).append((start_ts, stop_ts, title or ""))
+
+    channels = {}
+    for channel in sorted(by_channel):
+        entries = sorted(by_channel[channel])
+        channels[channel] = {
+            "starts": [entry[0] for entry in entries],
+            "stops": [entry[1] for entry in entries],
+            "titles": [entry[2] for entry in entries],
+        }
+    return {"generated": int(time.time()), "channels": channels}
+
+
+def write_programme_index(path, index):
+    """写入索引，先写临时文件再替换。"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_programme_index(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_programme(index, channel, timestamp=None):
+    """
+    查询 channel 在 timestamp（默认为当前时间）正在播出的节目。
+
+    返回:
+        (int, int, str) 或 None: 开始时间戳, 结束时间戳, 节目名
+    """
+    entry = index["channels"].get(channel)
+    if not entry:
+        return None
+    timestamp = time.time() if timestamp is None else timestamp
+    position = bisect.bisect_right(entry["starts"], timestamp) - 1
+    if position >= 0 and entry["stops"][position] > timestamp:
+        return entry["starts"][position], entry["stops"][position], entry["titles"][position]
+    return None
@@ -0,0 +1,179 @@
+# utils/health_store.py
+"""
+流地址健康历史库（sqlite）。
+
+按流地址记录最近一次检查的状态、延迟、吞吐量以及连续成功/失败次数，按主机汇总成功/失败计数，
+并据此安排下一次检查的时间（指数退避）：
+- 稳定可用的地址随连续成功次数增加，检查间隔逐步拉长；
+- 失败的地址同样按连续失败次数退避，长期失效的地址在退避期内直接视为不可用，不再探测；
+- 状态刚发生变化（不稳定）的地址连续次数被重置，会很快再次检查。
+每次运行只需探测到期或从未检查过的地址。
+"""
+import os
+import time
+import sqlite3
+from urllib.parse import urlsplit
+
+# 可用地址的检查间隔：从 OK_BASE_INTERVAL 开始按连续成功次数翻倍，最长 OK_MAX_INTERVAL（秒）
+OK_BASE_INTERVAL = 6 * 3600
+OK_MAX_INTERVAL = 3 * 86400
+
+# 失败地址的重试间隔：从 FAIL_BASE_INTERVAL 开始按连续失败次数翻倍，最长 FAIL_MAX_INTERVAL（秒）
+FAIL_BASE_INTERVAL = 12 * 3600
+FAIL_MAX_INTERVAL = 14 * 86400
+
+# 超过该天数未再出现在任何源中的地址会被清理
+STALE_DAYS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS streams (
+    url TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    last_ok INTEGER NOT NULL,
+    latency REAL,
+    throughput REAL,
+    last_checked REAL NOT NULL,
+    next_check REAL NOT NULL,
+    ok_streak INTEGER NOT NULL DEFAULT 0,
+    fail_streak INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    ok_count INTEGER NOT NULL DEFAULT 0,
+    fail_count INTEGER NOT NULL DEFAULT 0,
+    last_checked REAL
+);
+"""
+
+
+def backoff_interval(base, maximum, streak):
+    """第 streak 次连续相同结果后的间隔：base * 2^(streak-1)，不超过 maximum。"""
+    return min(base * (2 ** max(streak - 1, 0)), maximum)
+
+
+class HealthStore:
+    """流地址健康历史库，见模块说明。"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load_rows(self, urls):
+        """分批读取地址对应的记录，返回 url -> (last_ok, next_check, latency, throughput)。"""
+        rows = {}
+        urls = list(urls)
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for url, last_ok, next_check, latency, throughput in self._conn.execute(
+                f"SELECT url, last_ok, next_check, latency, throughput FROM streams WHERE url IN ({placeholders})",
+                batch,
+            ):
+                rows[url] = (last_ok, next_check, latency, throughput)
+        return rows
+
+    def plan_checks(self, urls, now=None):
+        """
+        根据历史记录决定本次需要探测的地址。
+
+        返回:
+            (to_check, known): to_check 为需要探测的地址列表（保持输入顺序）；
+                               known 为 url -> 上次结果 (bool) 的字典，对应未到期、直接沿用历史状态的地址
+        """
+        now = time.time() if now is None else now
+        urls = list(dict.fromkeys(urls))
+        rows = self._load_rows(urls)
+        to_check = []
+        known = {}
+        for url in urls:
+            row = rows.get(url)
+            if row is None or row[1] <= now:
+                to_check.append(url)
+            else:
+                known[url] = bool(row[0])
+        self._conn.executemany("UPDATE streams SET last_seen = ? WHERE url = ?", ((now, url) for url in known))
+        self._conn.commit()
+        return to_check, known
+
+    def record_results(self, results, now=None):
+        """
+        写入本次探测结果并安排下一次检查时间。
+
+        Args:
+            results: 可迭代的 (url, ProbeResult) 对。
+        """
+        now = time.time() if now is None else now
+        results = list(results)
+        previous = {}
+        for start in range(0, len(results), 500):
+            batch = [url for url, _ in results[start:start + 500]]
+            placeholders = ",".join("?" * len(batch))
+            for url, ok_streak, fail_streak in self._conn.execute(
+                f"SELECT url, ok_streak, fail_streak FROM streams WHERE url IN ({placeholders})", batch
+            ):
+                previous[url] = (ok_streak, fail_streak)
+
+        stream_rows = []
+        host_deltas = {}
+        for url, result in results:
+            ok_streak, fail_streak = previous.get(url, (0, 0))
+            if result.ok:
+                ok_streak, fail_streak = ok_streak + 1, 0
+                next_check = now + backoff_interval(OK_BASE_INTERVAL, OK_MAX_INTERVAL, ok_streak)
+            else:
+                ok_streak, fail_streak = 0, fail_streak + 1
+                next_check = now + backoff_interval(FAIL_BASE_INTERVAL, FAIL_MAX_INTERVAL, fail_streak)
+            host = urlsplit(url).hostname or ""
+            stream_rows.append((url, host, int(result.ok), result.latency, result.throughput, now, next_check,
+                                ok_streak, fail_streak, now))
+            ok_delta, fail_delta = host_deltas.get(host, (0, 0))
+            host_deltas[host] = (ok_delta + int(result.ok), fail_delta + int(not result.ok))
+
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO streams (url, host, last_ok, latency, throughput, last_checked, next_check, "
+            "ok_streak, fail_streak, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            stream_rows,
+        )
+        self._conn.executemany(
+            "INSERT INTO hosts (host, ok_count, fail_count, last_checked) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(host) DO UPDATE SET ok_count = ok_count + excluded.ok_count, "
+            "fail_count = fail_count + excluded.fail_count, last_checked = excluded.last_checked",
+            ((host, ok, fail, now) for host, (ok, fail) in host_deltas.items()),
+        )
+        self._conn.commit()
+
+    def load_stream_health(self):
+        """返回 url -> (上次是否可用, 延迟) 的字典，供排序使用。"""
+        return {
+            url: (bool(last_ok), latency)
+            for url, last_ok, latency in self._conn.execute("SELECT url, last_ok, latency FROM streams")
+        }
+
+    def load_host_reliability(self):
+        """返回 host -> 历史成功率 (0~1) 的字典。"""
+        return {
+            host: ok_count / (ok_count + fail_count)
+            for host, ok_count, fail_count in self._conn.execute("SELECT host, ok_count, fail_count FROM hosts")
+            if ok_count + fail_count
+        }
+
+    def prune(self, now=None, stale_days=STALE_DAYS):
+        """删除超过 stale_days 天未出现在任何源中的地址，返回删除的条数。"""
+        now = time.time() if now is None else now
+        cursor = self._conn.execute("DELETE FROM streams WHERE last_seen < ?", (now - stale_days * 86400,))
+        self._conn.commit()
+        return cursor.rowcount
@@ -1,5 +1,67 @@
 # utils/m3u_parse.py
 import re
+import sys
+import codecs
+from typing import NamedTuple, Optional
+
+
+class Channel(NamedTuple):
+    """
+    一条频道记录。
+
+    与原先的 7 元组完全兼容（可按位置解包和索引），但字段有名字，且不比普通元组占用更多内存。
+    """
+    tvg_name: Optional[str]
+    tvg_id: Optional[str]
+    tvg_logo: Optional[str]
+    group_title: Optional[str]
+    title: str
+    headers: tuple
+    url: str
+
+
+# 重复出现的头部信息元组共用同一个对象；超过上限时清空重建
+_HEADERS_POOL = {}
+_HEADERS_POOL_LIMIT = 10_000
+
+
+def intern_headers(headers):
+    """返回与 headers 相等的共享元组，避免每个频道各持有一份相同的头部信息。"""
+    if not headers:
+        return ()
+    shared = _HEADERS_POOL.get(headers)
+    if shared is None:
+        if len(_HEADERS_POOL) >= _HEADERS_POOL_LIMIT:
+            _HEADERS_POOL.clear()
+        shared = _HEADERS_POOL[headers] = headers
+    return shared
+
+
+# 一条频道记录：#EXTINF 行、紧随其后的 # 头部行/空行、URL 行。
+# 在整段文本上用一个预编译正则匹配，替代逐行的 Python 状态机；行首尾空白在捕获后再 strip。
+_RECORD_PATTERN = re.compile(
+    r'^[^\S\n]*(#EXTINF:[^\n]*)\n'                       # #EXTINF 行
+    r'((?:[^\S\n]*(?:(?!#EXTINF:)#[^\n]*)?\n)*)'          # 头部信息行（如 #EXTVLCOPT）和空行
+    r'[^\S\n]*([^#\s][^\n]*)',                             # URL 行
+    re.MULTILINE
+)
+
+# splitlines() 视为换行、但 _RECORD_PATTERN 不认识的行分隔符；出现时先按 splitlines() 统一为 \n
+_OTHER_LINE_BREAKS = re.compile('[\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+
+
+def _compile_attr_search(name):
+    """
+    预编译单个属性的查找函数，支持双引号、单引号和不带引号的值。
+    以属性名开头的正则可以走 re 的字面量前缀快速查找，比通用的 key=value 分词器更快。
+    """
+    return re.compile(name + r"""=(?:"([^"]+)"|'([^']+)'|([^\s"',]+))""").search
+
+
+_search_tvg_id = _compile_attr_search('tvg-id')
+_search_tvg_name = _compile_attr_search('tvg-name')
+_search_tvg_logo = _compile_attr_search('tvg-logo')
+_search_group_title = _compile_attr_search('group-title')
 
 
 def parse_m3u(m3u_content):
@@ -7,62 +69,101 @@ def parse_m3u(m3u_content):
     m3u解析器：#EXTINF 和 URL，返回一个详细的记录列表。
     输入：m3u文本内容
     包含信息：tvg-name, tvg-id, tvg-logo, group-title, title, headers, url
-    输出：元组列表 [(), (), ...]
+    输出：Channel 列表 [Channel(...), ...]
+
+    - 新的 #EXTINF 出现时，前一个没有 URL 的 #EXTINF 会被丢弃。
+    - #EXTINF 与 URL 之间以 # 开头的行作为该频道的头部信息。
+    - 属性值支持 key="value"、key='value' 和 key=value 三种写法。
+    - group-title、tvg-logo 和头部信息在大量频道间重复，会被驻留（intern）为共享对象以节省内存。
     """
     if not m3u_content:
         return []
 
-    lines = m3u_content.splitlines()
-    channels = []
-    extinf = None
-    headers = []
-
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
+    if '\r' in m3u_content:
+        m3u_content = m3u_content.replace('\r\n', '\n')
+    if _OTHER_LINE_BREAKS.search(m3u_content):
+        m3u_content = '\n'.join(m3u_content.splitlines())
 
-        if line.startswith('#EXTINF:'):
-            # 如果我们找到一个新的 #EXTINF，但前一个没有URL，就丢弃前一个。
-            extinf = line
-            headers = []
-        elif line.startswith('#') and extinf:
-            # 这是与当前 #EXTINF 关联的头部信息行
-            headers.append(line)
-        elif extinf and not line.startswith('#'):
-            # 这应该是当前频道的 URL
-            url = line
-            tvg_id = get_attr(r'tvg-id="([^"]+)"', extinf)
-            tvg_name = get_attr(r'tvg-name="([^"]+)"', extinf)
-            tvg_logo = get_attr(r'tvg-logo="([^"]+)"', extinf)
-            group_title = get_attr(r'group-title="([^"]+)"', extinf)
-
-            try:
-                title = extinf.rsplit(",", 1)[-1].strip()
-            except IndexError:
-                title = tvg_name if tvg_name else "Unknown"
-
-            # 添加完整的频道数据
-            channels.append((tvg_name, tvg_id, tvg_logo, group_title, title, tuple(headers), url))
-
-            # 为下一个频道重置状态
-            extinf = None
-            headers = []
+    channels = []
+    append = channels.append
+    search_id, search_name = _search_tvg_id, _search_tvg_name
+    search_logo, search_group = _search_tvg_logo, _search_group_title
+    intern = sys.intern
+    # 直接调用 tuple.__new__ 构造 Channel，跳过 NamedTuple 的 Python 层 __new__
+    new_channel = tuple.__new__
+
+    for extinf, header_block, url in _RECORD_PATTERN.findall(m3u_content):
+        extinf = extinf.rstrip()
+        if header_block:
+            headers = intern_headers(tuple(line for line in map(str.strip, header_block.split('\n')) if line))
+        else:
+            headers = ()
+
+        tvg_name = search_name(extinf)
+        tvg_id = search_id(extinf)
+        tvg_logo = search_logo(extinf)
+        group_title = search_group(extinf)
+
+        append(new_channel(Channel, (
+            tvg_name and tvg_name[tvg_name.lastindex],
+            tvg_id and tvg_id[tvg_id.lastindex],
+            tvg_logo and intern(tvg_logo[tvg_logo.lastindex]),
+            group_title and intern(group_title[group_title.lastindex]),
+            extinf.rsplit(",", 1)[-1].strip(),
+            headers,
+            url.rstrip(),
+        )))
 
     return channels
 
 
-def get_attr(pattern, text):
+def iter_m3u(stream, encoding='utf-8', chunk_size=1 << 16):
     """
-    从 M3U 属性字符串中提取指定属性的值。
-    
-    :param pattern: 正则表达式模式，例如 r'tvg-id="([^"]+)"'
-    :param text: 要搜索的文本（通常是 #EXTINF 行）
-    :return: 匹配的值，如果未找到则返回 None
+    流式 m3u 解析器，逐条产出与 parse_m3u 相同的 Channel 记录。
+
+    stream 可以是：
+    - requests 的流式响应（stream=True），按 iter_content 分块读取；
+    - 文本或二进制文件对象；
+    - 任意产出 str / bytes 块的可迭代对象。
+    bytes 块按 encoding 增量解码。文本在每个块内最后一个 "\n#EXTINF:" 处切开，
+    前半部分交给 parse_m3u，因此任何时刻只在内存中保留一个块左右的正文。
     """
-    match = re.search(pattern, text)
-    return match.group(1) if match else None
+    decoder = None
+    pending = []
+    for chunk in _iter_chunks(stream, chunk_size):
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            chunk = decoder.decode(chunk)
+        if not chunk:
+            continue
+        # 新的 #EXTINF 会终止之前未完成的记录，所以在它之前切开不会改变解析结果
+        cut = chunk.rfind('\n#EXTINF:')
+        if cut < 0:
+            pending.append(chunk)
+            continue
+        pending.append(chunk[:cut + 1])
+        yield from parse_m3u(''.join(pending))
+        pending = [chunk[cut + 1:]]
+
+    if decoder is not None:
+        pending.append(decoder.decode(b'', final=True))
+    yield from parse_m3u(''.join(pending))
+
+
+def _iter_chunks(stream, chunk_size):
+    """把响应对象、文件对象或可迭代对象统一为块迭代器。"""
+    if hasattr(stream, 'iter_content'):
+        yield from stream.iter_content(chunk_size)
+    elif hasattr(stream, 'read'):
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from stream
+
 
 def parse_simple(m3u_text):
     """
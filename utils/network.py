@@ -1,62 +1,162 @@
 # utils/network.py
+import os
 import re
 import time
+import hashlib
+import threading
+from typing import NamedTuple
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 
 import requests
 
-from utils.m3u_parse import _parse_m3u_headers
+from utils.source_cache import get_cache_paths, load_cache_meta, build_conditional_headers, save_cache_meta
 
 
-def fetch_playlist_content(url, retries=3, timeout=15):
-    """获取并返回播放列表内容（文本）"""
+# 流式下载时每次读取的块大小
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+
+class DownloadedSource(NamedTuple):
+    """已落盘的播放列表源：正文路径、正文 sha256 以及解码用的编码。"""
+    url: str
+    path: str
+    digest: str
+    encoding: str
+
+
+def download_playlist(url, cache_dir, retries=3, timeout=15, deadline=None):
+    """
+    以流式方式把播放列表正文下载到 cache_dir，返回 DownloadedSource；失败时返回 None。
+
+    正文按块写入磁盘并同时计算 sha256，不会在内存中保留完整正文。
+    cache_dir 中已有该源的缓存时发送 ETag / Last-Modified 条件请求，304 时直接使用缓存正文，
+    所有尝试都失败时回退到最后一次成功下载的副本。
+    deadline 为 time.monotonic() 时间点（可选），到达后不再重试，单次请求的超时也会被截断到剩余时间，
+    正在进行的下载也会在下一个数据块前中止。
+    """
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
     }
+    os.makedirs(cache_dir, exist_ok=True)
+    body_path, _ = get_cache_paths(cache_dir, url)
+    meta = load_cache_meta(cache_dir, url)
+    cached = DownloadedSource(url, body_path, meta['sha256'], meta['encoding']) if meta else None
+    if meta:
+        headers.update(build_conditional_headers(meta))
+
     for attempt in range(1, retries + 1):
+        request_timeout = timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"⏰ Deadline reached, giving up on {url}.")
+                break
+            request_timeout = min(timeout, remaining)
+        tmp_path = f"{body_path}.tmp"
         try:
             print(f"Attempting to fetch {url} (try {attempt})...")
-            res = requests.get(url, timeout=timeout, headers=headers)
-            res.raise_for_status()
+            with requests.get(url, timeout=request_timeout, headers=headers, stream=True) as res:
+                if res.status_code == 304 and cached:
+                    print(f"♻️ Not modified, using cached copy of {url}")
+                    return cached
+                res.raise_for_status()
+                digest = hashlib.sha256()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in res.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        # 到达时限后立即停止写入，不再改动缓存目录
+                        if deadline is not None and time.monotonic() > deadline:
+                            raise TimeoutError("deadline reached during download")
+                        digest.update(chunk)
+                        f.write(chunk)
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("deadline reached during download")
+                os.replace(tmp_path, body_path)
+                meta = {
+                    'etag': res.headers.get('ETag'),
+                    'last_modified': res.headers.get('Last-Modified'),
+                    'sha256': digest.hexdigest(),
+                    'encoding': res.encoding or 'utf-8',
+                }
+            try:
+                save_cache_meta(cache_dir, url, meta)
+            except OSError as e:
+                print(f"⚠️ Failed to cache {url}: {e}")
             print(f"✅ Successfully fetched {url}")
-            return res.text
+            return DownloadedSource(url, body_path, meta['sha256'], meta['encoding'])
         except Exception as e:
             print(f"❌ Attempt {attempt} failed for {url}: {e}")
-            time.sleep(2)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if attempt < retries:
+                time.sleep(2)
+
+    if cached:
+        print(f"⚠️ {url} is unavailable, falling back to the last cached copy.")
+        return cached
     print(f"⚠️ Skipping {url} after {retries} failed attempts.")
-    return ""
+    return None
 
 
-def is_url_accessible(url, m3u_headers=None, timeout=30):
+def fetch_playlists_concurrently(urls, cache_dir, max_workers=16, per_host_limit=8, deadline_seconds=None, retries=3,
+                                 timeout=15):
     """
-    通过发送 HEAD 请求快速检查 URL 是否可访问并返回状态码 200。
-    此版本已支持 M3U 中的自定义头部信息。
+    并发下载多个播放列表到 cache_dir，按完成顺序逐个产出 (url, DownloadedSource 或 None)。
 
-    Args:
-        url (str): 要检查的 URL。
-        m3u_headers (tuple, optional): 从 M3U 文件解析的原始头部行。
-        timeout (int, optional): 请求超时时间（秒）。默认为 30。
+    - max_workers: 全局最大并发下载数。
+    - per_host_limit: 同一主机的最大并发数，避免对单个站点（如 raw.githubusercontent.com）请求过猛。
+    - deadline_seconds: 整个下载阶段的总时限（秒），超时后未完成的源使用缓存副本，没有缓存的源被跳过。
 
-    Returns:
-        bool: 如果 URL 可访问且状态码为 200，则返回 True，否则返回 False。
+    总耗时约等于最慢的那个源，而不是所有源耗时之和。
     """
-    # 默认的 User-Agent
-    final_headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
-    }
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return
 
-    # 解析并合并来自M3U的自定义头部
-    # 如果M3U中也定义了User-Agent，它将覆盖上面的默认值
-    custom_headers = _parse_m3u_headers(m3u_headers)
-    final_headers.update(custom_headers)
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    host_semaphores = {}
+    for url in urls:
+        host = urlsplit(url).hostname or ""
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(per_host_limit)
 
-    try:
-        # 使用 HEAD 请求，因为它只获取头部信息，速度更快，适合检查连通性
-        # allow_redirects=True 确保在遇到重定向时能追踪到最终地址
-        response = requests.head(url, timeout=timeout, headers=final_headers, allow_redirects=True)
+    def _fetch(url):
+        with host_semaphores[urlsplit(url).hostname or ""]:
+            return download_playlist(url, cache_dir, retries=retries, timeout=timeout, deadline=deadline)
 
-        # 检查最终的响应状态码是否为 200 (OK)
-        return response.status_code == 200
+    def _result(future, url):
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"❌ Unexpected error while fetching {url}: {e}")
+            return None
 
-    except requests.exceptions.RequestException:
-        # 捕获所有 requests 相关的异常 (如超时, 连接错误等)，静默处理
-        return False
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    future_to_url = {executor.submit(_fetch, url): url for url in urls}
+    yielded = set()
+    try:
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        for future in as_completed(future_to_url, timeout=remaining):
+            yielded.add(future)
+            yield future_to_url[future], _result(future, future_to_url[future])
+    except FuturesTimeoutError:
+        # as_completed 超时时不会再产出它最后一次唤醒之后才完成的任务，这些结果在这里补上；
+        # 仍未完成的源回退到最后一次成功下载的副本（如果有）
+        unfinished = [(future, url) for future, url in future_to_url.items() if future not in yielded]
+        pending = skipped = 0
+        for future, url in unfinished:
+            if future.done():
+                yield url, _result(future, url)
+                continue
+            pending += 1
+            meta = load_cache_meta(cache_dir, url)
+            if meta:
+                body_path, _ = get_cache_paths(cache_dir, url)
+                print(f"⚠️ {url} did not finish before the deadline, falling back to the last cached copy.")
+                yield url, DownloadedSource(url, body_path, meta['sha256'], meta['encoding'])
+            else:
+                skipped += 1
+        print(f"⏰ Fetch deadline of {deadline_seconds}s reached, skipping {skipped} of {pending} unfinished sources.")
+    finally:
+        # 不等待仍在运行的下载线程，未开始的任务直接取消
+        executor.shutdown(wait=False, cancel_futures=True)
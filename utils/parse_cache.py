@@ -0,0 +1,136 @@
+# utils/parse_cache.py
+"""
+解析结果缓存：以源正文的 sha256 为键，把解析出的 Channel 记录用 pickle 保存到磁盘。
+正文与上次完全相同时直接加载解析结果，跳过逐行正则解析。
+
+缓存文件由若干个连续的 pickle 批次和一个结束标记组成，读写都是流式的，不需要一次性在内存中持有整个源的频道列表。
+"""
+import os
+import time
+import pickle
+
+from utils.m3u_parse import iter_m3u
+
+# 解析结果的格式或解析规则变化时递增，使旧缓存自动失效
+PARSE_CACHE_VERSION = 5
+
+# 每个 pickle 批次包含的频道数
+PARSE_CACHE_BATCH_SIZE = 5000
+
+# 缓存文件最后一条记录；读不到它说明文件被截断
+_END_OF_CACHE = None
+
+# 读取缓存时视为文件损坏的异常
+_CACHE_READ_ERRORS = (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError, TypeError, IndexError)
+
+
+def get_parse_cache_path(cache_dir, digest, encoding):
+    return os.path.join(cache_dir, f"v{PARSE_CACHE_VERSION}-{digest}-{encoding.lower()}.pkl")
+
+
+def _write_cache_record(cache_file, record, cache_path):
+    """写入一条记录；写入失败时打印警告、关闭文件并返回 None（之后不再写缓存），不影响解析结果。"""
+    if cache_file is None:
+        return None
+    try:
+        pickle.dump(record, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        return cache_file
+    except OSError as e:
+        print(f"⚠️ Failed to write parse cache {cache_path}: {e}")
+        cache_file.close()
+        return None
+
+
+def iter_m3u_cached(path, digest, cache_dir=None, encoding='utf-8'):
+    """
+    带缓存的流式解析：逐条产出 path 中播放列表的 Channel 记录。
+
+    cache_dir 为空时等同于 iter_m3u；否则先按正文摘要 digest 查找缓存，
+    未命中时边解析边写入缓存，只有在完整遍历后才会生效。
+    缓存文件损坏（无法反序列化或缺少结束标记）时删除它并重新解析源，跳过已经产出的频道；
+    写入缓存失败只打印警告。
+    """
+    yielded = 0
+    if cache_dir:
+        cache_path = get_parse_cache_path(cache_dir, digest, encoding)
+        try:
+            with open(cache_path, 'rb') as f:
+                while True:
+                    batch = pickle.load(f)
+                    if batch is _END_OF_CACHE:
+                        break
+                    if not isinstance(batch, list):
+                        raise ValueError(f"unexpected record of type {type(batch).__name__}")
+                    yield from batch
+                    yielded += len(batch)
+            # 更新修改时间，供 prune_parse_cache 判断是否仍在使用
+            os.utime(cache_path)
+            return
+        except FileNotFoundError:
+            pass
+        except _CACHE_READ_ERRORS as e:
+            print(f"⚠️ Ignoring unreadable parse cache {cache_path}: {e}")
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
+    with open(path, 'rb') as source:
+        channels = iter_m3u(source, encoding)
+        if not cache_dir:
+            yield from channels
+            return
+
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_file = open(tmp_path, 'wb')
+        except OSError as e:
+            print(f"⚠️ Failed to write parse cache {cache_path}: {e}")
+            cache_file = None
+        completed = False
+        try:
+            batch = []
+            for index, channel in enumerate(channels):
+                # 从损坏的缓存中已经产出的频道不再重复产出
+                if index >= yielded:
+                    yield channel
+                if cache_file is not None:
+                    batch.append(channel)
+                    if len(batch) >= PARSE_CACHE_BATCH_SIZE:
+                        cache_file = _write_cache_record(cache_file, batch, cache_path)
+                        batch = []
+            cache_file = _write_cache_record(cache_file, batch, cache_path)
+            cache_file = _write_cache_record(cache_file, _END_OF_CACHE, cache_path)
+            if cache_file is not None:
+                try:
+                    cache_file.close()
+                    os.replace(tmp_path, cache_path)
+                    completed = True
+                except OSError as e:
+                    print(f"⚠️ Failed to write parse cache {cache_path}: {e}")
+        finally:
+            if cache_file is not None:
+                cache_file.close()
+            if not completed and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+
+def prune_parse_cache(cache_dir, max_age_days=7):
+    """删除超过 max_age_days 天未被使用的缓存文件，返回删除的文件数。"""
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
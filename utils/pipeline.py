@@ -0,0 +1,127 @@
+# utils/pipeline.py
+"""
+播放列表合并流水线的基础组件：下载 → 解析/规范化 → 探测 → 合并 各阶段同时进行。
+
+- SourceWindow：按下载完成顺序到达、按 playlist_urls 顺序产出处理结果的有界重排窗口，
+  只有落在窗口内的源会进入解析阶段，其余的源留在磁盘上等待（背压），保证输出与下载完成顺序无关；
+- StageMetrics：各阶段的条目数、吞吐量和忙碌时间统计。
+"""
+import time
+import threading
+
+
+class StageMetrics:
+    """单个流水线阶段的吞吐统计；耗时从创建（流水线启动）到 finish() 为止。"""
+
+    def __init__(self, name, unit="items"):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.units = 0
+        self.busy = 0.0
+        self._started = time.perf_counter()
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def record(self, units=0, busy=0.0):
+        """记录处理完的一个条目（例如一个源），units 为其包含的单位数（例如频道数、字节数）。"""
+        with self._lock:
+            self.items += 1
+            self.units += units
+            self.busy += busy
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self._finished or time.perf_counter()) - self._started
+        rate = self.units / elapsed if elapsed > 0 else 0.0
+        text = f"{self.name}: {self.items} items, {self.units} {self.unit} in {elapsed:.2f}s ({rate:.0f} {self.unit}/s"
+        if self.busy:
+            text += f", busy {self.busy:.2f}s"
+        return text + ")"
+
+
+class SourceWindow:
+    """
+    乱序到达、按序产出的有界重排窗口。
+
+    - 下载阶段对每个源调用 arrive(index, item)（失败的源 item 为 None），全部结束后调用 close()；
+    - 调度方反复调用 next_ready() 取得可以开始处理的源，处理结果通过 complete(index, result) 放回；
+    - 合并方迭代 results()，按下标顺序取得结果，未到达（例如超过下载时限）的源产出 None；
+    - 下载或调度线程异常退出时调用 fail(error)，之后 next_ready() 返回 None，results() 抛出该异常，不会一直等待。
+
+    只有下标小于 "已产出的结果数 + window" 的源会被 next_ready() 交出，
+    因此同时处于处理中或等待产出的源不超过 window 个。
+    """
+
+    def __init__(self, count, window):
+        self._count = count
+        self._window = max(1, window)
+        self._cond = threading.Condition()
+        self._arrived = {}        # 已到达、尚未交给处理阶段的源
+        self._processing = set()  # 已交给处理阶段、尚未完成的下标
+        self._done = {}           # 已完成、尚未产出的结果
+        self._next_output = 0
+        self._closed = False
+        self._error = None
+
+    def arrive(self, index, item):
+        with self._cond:
+            self._arrived[index] = item
+            self._cond.notify_all()
+
+    def close(self):
+        """下载阶段结束，之后未到达的源视为失败。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def fail(self, error):
+        """记录使流水线无法继续的异常（只保留第一个），唤醒所有等待方。"""
+        with self._cond:
+            if self._error is None:
+                self._error = error
+            self._cond.notify_all()
+
+    def next_ready(self):
+        """
+        阻塞直到有源可以开始处理，返回 (index, item)，同时有多个时取下标最小的；
+        下载已结束且所有到达的源都已交出，或流水线已失败时返回 None。
+        """
+        with self._cond:
+            while True:
+                if self._error is not None:
+                    return None
+                limit = self._next_output + self._window
+                ready = [index for index in self._arrived if index < limit]
+                if ready:
+                    index = min(ready)
+                    self._processing.add(index)
+                    return index, self._arrived.pop(index)
+                if self._closed and not self._arrived:
+                    return None
+                self._cond.wait()
+
+    def complete(self, index, result):
+        with self._cond:
+            self._processing.discard(index)
+            self._done[index] = result
+            self._cond.notify_all()
+
+    def _is_missing(self, index):
+        return (self._closed and index not in self._arrived and index not in self._processing
+                and index not in self._done)
+
+    def results(self):
+        """按下标顺序产出各源的处理结果；流水线失败时抛出 fail() 记录的异常。"""
+        for index in range(self._count):
+            with self._cond:
+                while index not in self._done and not self._is_missing(index) and self._error is None:
+                    self._cond.wait()
+                if self._error is not None:
+                    raise self._error
+                result = self._done.pop(index, None)
+                self._next_output = index + 1
+                self._cond.notify_all()
+            yield result
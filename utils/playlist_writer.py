@@ -3,38 +3,65 @@
 """
 from tqdm import tqdm
 from utils.channel_filter import get_official_name
+from utils.m3u_parse import Channel
+from utils.filter_keywords import compile_keyword_matcher
+from utils.stream_rank import select_top_streams
+from utils.url_canonical import canonical_url_key
 
 
-def process_and_normalize_channels(accessible_channels, official_names, official_to_aliases, alias_to_official, official_lower_to_original, is_nsfw_func, channels_txt_filter, category_filter, category_key):
+def process_and_normalize_channels(accessible_channels, official_names, official_to_aliases, alias_to_official, official_lower_to_original, is_nsfw_func, channels_txt_filter, category_filter, category_key, alias_matcher=None, stream_scorer=None, max_streams_per_channel=None):
     """
     对频道列表进行规范化、去重和统一化处理。
     - 过滤 NSFW 内容和非指定分类。
     - 根据 channels.txt 过滤频道（仅保留 channels.txt 中的频道及其别名）。
     - 使用 channels.txt 中的正式名作为最终的 title 和 tvg-name。
-    - 过滤 url 完全重复的条目。
+    - 过滤指向同一个流的重复条目（按 canonical_url_key 归一后比较），保留第一次出现的条目；
+      同一个流同时有 http 和 https 地址时使用 https 地址。
     - 统一同名频道的 TVG 信息。
+    - 给定 stream_scorer 时，同一频道的多个流按得分排序，每个频道最多保留 max_streams_per_channel 个。
+
+    alias_matcher 为 load_channels_txt 返回的预编译别名匹配器，用于加速 get_official_name。
+    accessible_channels 可以是列表，也可以是逐条产出 Channel 记录的迭代器（如 iter_m3u），会被惰性消费。
+
+    处理分为两步：逐条独立的 normalize_channels，以及依赖处理顺序的 merge_normalized_channels；
+    前者可以按源分片在多个进程中执行（见 mergeclean.py），结果按源的顺序交给后者，输出与这里完全一致。
     """
     print("\n🔍 Starting data normalization, de-duplication, and unification...")
 
-    processed_urls = set()
-    master_tvg_info = {}
-    final_channels = []
-    filtered_count = 0
     processed_official_names = set()
+    normalized = normalize_channels(
+        tqdm(accessible_channels, desc="Processing & Unifying"), official_names, official_to_aliases,
+        alias_to_official, official_lower_to_original, is_nsfw_func, channels_txt_filter, category_filter,
+        category_key, processed_official_names, alias_matcher
+    )
+    final_channels = merge_normalized_channels(normalized, stream_scorer, max_streams_per_channel)
+    return final_channels, processed_official_names
 
-    for tvg_name, tvg_id, tvg_logo, group_title, title, headers, url in tqdm(accessible_channels,
-                                                                             desc="Processing & Unifying"):
-        # 检查是否为 NSFW 内容
+
+def normalize_channels(channels, official_names, official_to_aliases, alias_to_official, official_lower_to_original, is_nsfw_func, channels_txt_filter, category_filter, category_key, processed_official_names, alias_matcher=None):
+    """
+    逐条过滤和规范化频道（NSFW、channels.txt、分类），每条频道的结果只取决于它本身。
+
+    匹配到的正式名（小写）加入 processed_official_names。
+
+    产出:
+        保留的频道为 (official_title, url_key, channel)，被过滤的频道为 None（用于统计过滤数量）。
+    """
+    # 分类关键词在整个处理过程中只编译一次
+    match_category = compile_keyword_matcher([k.lower() for k in category_key]) if category_filter else None
+
+    for channel in channels:
+        tvg_name, tvg_id, tvg_logo, group_title, title, headers, url = channel
         # 检查是否为 NSFW 内容
         if is_nsfw_func(group_title, title):
-            filtered_count += 1
+            yield None
             continue
 
         # channels.txt 过滤：获取正式名
         if channels_txt_filter:
-            is_match, official_name_lower = get_official_name(title, official_names, official_to_aliases, alias_to_official)
+            is_match, official_name_lower = get_official_name(title, official_names, official_to_aliases, alias_to_official, alias_matcher)
             if not is_match:
-                filtered_count += 1
+                yield None
                 continue
             # 获取原始正式名
             official_title = official_lower_to_original.get(official_name_lower, official_name_lower)
@@ -43,23 +70,54 @@ def process_and_normalize_channels(accessible_channels, official_names, official
             # 如果不启用 channels.txt 过滤，则使用原始 title
             official_title = title
             # 为了缺失频道统计，尝试提取可能的 official_name_lower
-            is_match, official_name_lower = get_official_name(title, official_names, official_to_aliases, alias_to_official)
+            is_match, official_name_lower = get_official_name(title, official_names, official_to_aliases, alias_to_official, alias_matcher)
             if is_match:
                 processed_official_names.add(official_name_lower)
 
         # 分类过滤
         if category_filter:
-            lower_keywords = [k.lower() for k in category_key]
             searchable_text = f'{tvg_name}, {group_title}, {title}'.lower()
-            if not any(keyword in searchable_text for keyword in lower_keywords):
-                filtered_count += 1
+            if not match_category(searchable_text):
+                yield None
                 continue
 
-        # 过滤 url 完全重复的条目
-        if url in processed_urls:
+        yield official_title, canonical_url_key(url), channel
+
+
+def merge_normalized_channels(normalized, stream_scorer=None, max_streams_per_channel=None):
+    """
+    按顺序合并 normalize_channels 的结果：过滤重复的流（同一个流有 http 和 https 地址时使用 https）、
+    统一同名频道的 TVG 信息（取第一次出现的），
+    给定 stream_scorer 时按得分保留每个频道的前 max_streams_per_channel 个流。
+
+    返回:
+        list: 最终的 Channel 列表
+    """
+    processed_url_keys = {}   # url_key -> 该流在 final_channels 中的下标
+    master_tvg_info = {}
+    final_channels = []
+    filtered_count = 0
+    scores = []
+    score_titles = []
+
+    for item in normalized:
+        if item is None:
             filtered_count += 1
             continue
-        processed_urls.add(url)
+        official_title, url_key, (tvg_name, tvg_id, tvg_logo, group_title, title, headers, url) = item
+
+        # 过滤重复的流：协议、查询参数顺序、跟踪参数或结尾斜杠不同的地址视为同一个流
+        kept_index = processed_url_keys.get(url_key)
+        if kept_index is not None:
+            filtered_count += 1
+            kept = final_channels[kept_index]
+            # 检查 URL 时 http 和 https 地址分别探测，能走到这里的 https 地址同样是检查过的
+            if url.lower().startswith('https://') and kept.url.lower().startswith('http://'):
+                final_channels[kept_index] = kept._replace(headers=headers, url=url)
+                if stream_scorer:
+                    scores[kept_index] = stream_scorer(score_titles[kept_index], url)
+            continue
+        processed_url_keys[url_key] = len(final_channels)
 
         key = official_title.lower()
 
@@ -71,15 +129,26 @@ def process_and_normalize_channels(accessible_channels, official_names, official
 
         # 使用统一后的信息构建最终的频道数据
         # 使用 official_title 作为 title 和 tvg-name
-        unified_channel = (
+        unified_channel = Channel(
            official_title, tvg_id, master_tvg_logo, master_group_title, official_title, headers, url
         )
         final_channels.append(unified_channel)
+        if stream_scorer:
+            # 使用原始标题打分，分辨率提示在正式名中已经不存在
+            scores.append(stream_scorer(title, url))
+            score_titles.append(title)
+
+    if stream_scorer:
+        ranked_count = len(final_channels)
+        final_channels = select_top_streams(final_channels, scores, max_streams_per_channel)
+        if len(final_channels) < ranked_count:
+            print(f"🏅 Kept the top {max_streams_per_channel} streams per channel, dropped {ranked_count - len(final_channels)} lower-ranked streams.")
+            filtered_count += ranked_count - len(final_channels)
 
     if filtered_count > 0:
         print(f"🚫 Filtered out {filtered_count} channels based on filters.")
     print(f"✅ Kept {len(final_channels)} channels after processing.")
-    return final_channels, processed_official_names
+    return final_channels
 
 
 def write_merged_playlist(final_channels_to_write, epg_url, output_file):
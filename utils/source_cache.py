@@ -0,0 +1,82 @@
+# utils/source_cache.py
+"""
+播放列表源的本地磁盘缓存。
+
+每个源保存两份文件（文件名为 URL 的 sha1）：
+    <key>.m3u   上次成功下载的原始正文（字节）
+    <key>.json  对应的 ETag / Last-Modified、正文 sha256 和编码等元信息
+下次下载时发送条件请求，服务器返回 304 时直接使用缓存正文；源暂时不可用时也可回退到最后一次的正常副本。
+已不在源列表中的 URL 的缓存由 prune_source_cache 清理。
+"""
+import os
+import re
+import json
+import hashlib
+
+# 缓存文件名：URL 的 sha1 加扩展名（包括写入中途留下的 .tmp 文件）
+_CACHE_FILE_RE = re.compile(r'^([0-9a-f]{40})\.')
+
+
+def _cache_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def get_cache_paths(cache_dir, url):
+    """返回 (正文路径, 元信息路径)。"""
+    key = _cache_key(url)
+    return os.path.join(cache_dir, f"{key}.m3u"), os.path.join(cache_dir, f"{key}.json")
+
+
+def load_cache_meta(cache_dir, url):
+    """
+    读取某个源的缓存元信息。
+
+    返回:
+        meta (dict): 元信息字典；正文文件缺失或元信息不完整时返回 {}
+    """
+    body_path, meta_path = get_cache_paths(cache_dir, url)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not meta.get('sha256') or not os.path.exists(body_path):
+        return {}
+    return meta
+
+
+def build_conditional_headers(meta):
+    """根据缓存元信息构建条件请求头。"""
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+
+def save_cache_meta(cache_dir, url, meta):
+    """保存元信息，先写临时文件再替换，避免中断时留下半个文件。"""
+    _, meta_path = get_cache_paths(cache_dir, url)
+    tmp_meta_path = f"{meta_path}.tmp"
+    with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, url=url), f, ensure_ascii=False)
+    os.replace(tmp_meta_path, meta_path)
+
+
+def prune_source_cache(cache_dir, urls):
+    """删除 URL 已不在 urls 中的源的正文和元信息（包括残留的临时文件），返回删除的文件数。"""
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return 0
+    keep = {_cache_key(url) for url in urls}
+    removed = 0
+    for name in os.listdir(cache_dir):
+        match = _CACHE_FILE_RE.match(name)
+        if not match or match.group(1) in keep:
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, name))
+            removed += 1
+        except OSError:
+            continue
+    return removed
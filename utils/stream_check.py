@@ -0,0 +1,364 @@
+# utils/stream_check.py
+"""
+基于 asyncio + aiohttp 的流地址可用性检查。
+
+与逐个线程发送 requests.head 相比：
+- 所有请求共用一个连接池（keep-alive），同一主机的后续探测不再重复 TCP/TLS 握手；
+- 通过连接池限制同一主机的并发数，并按主机轮转排列待检查地址，避免集中请求同一个上游；
+- 全局令牌桶限制每秒请求数；
+- HEAD 被拒绝（如 405）时改用只取 1 字节的 GET Range 请求。
+
+mode="hls" 时进行更深入的探测（见 probe_hls）：下载 HLS 清单、解析一个变体、再读取一个媒体分片的开头，
+并记录响应延迟和吞吐量，用于识别 "返回 200 但清单为空或已过期" 的假活链接。
+
+BackgroundProber 在后台线程的事件循环中持续接收待探测地址，供流水线边产生频道边探测。
+"""
+import asyncio
+import time
+import threading
+from collections import defaultdict
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit, urljoin
+
+import aiohttp
+from tqdm import tqdm
+
+from utils.m3u_parse import _parse_m3u_headers
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+
+# HEAD 返回这些状态码时，认为服务器不支持 HEAD，改用 GET Range 再试一次
+HEAD_FALLBACK_STATUSES = {400, 403, 405, 406, 501}
+
+# HLS 探测时清单的最大读取字节数，以及媒体分片只读取的开头字节数
+HLS_MANIFEST_MAX_BYTES = 1 << 20
+HLS_SEGMENT_PROBE_BYTES = 1 << 16
+
+
+class ProbeResult(NamedTuple):
+    """单个地址的探测结果。"""
+    ok: bool
+    latency: Optional[float] = None      # 首个请求从发出到收到响应头的耗时（秒）
+    throughput: Optional[float] = None   # 读取媒体数据时的吞吐量（字节/秒），仅 HLS 模式
+    reason: str = ""                     # 失败原因，便于日志排查
+
+
+class RateLimiter:
+    """简单的令牌桶：平均每秒最多放行 rate 个请求；rate 为 None 或 0 时不限制。"""
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_time > now:
+                await asyncio.sleep(self._next_time - now)
+                now = self._next_time
+            self._next_time = now + self._interval
+
+
+def build_request_headers(m3u_headers):
+    """默认 User-Agent 加上 M3U 中定义的头部（如 Referer），M3U 中的值优先。"""
+    headers = {"User-Agent": DEFAULT_USER_AGENT}
+    headers.update(_parse_m3u_headers(m3u_headers))
+    return headers
+
+
+def interleave_by_host(indexed_urls):
+    """
+    按主机轮转排列 (index, url, headers)，使相邻的请求尽量落在不同主机上，
+    避免某个主机的并发上限阻塞所有工作协程。
+    """
+    by_host = defaultdict(list)
+    for item in indexed_urls:
+        by_host[urlsplit(item[1]).hostname or ""].append(item)
+    queues = list(by_host.values())
+    result = []
+    position = 0
+    while queues:
+        remaining = []
+        for queue in queues:
+            if position < len(queue):
+                result.append(queue[position])
+                remaining.append(queue)
+        queues = remaining
+        position += 1
+    return result
+
+
+async def probe_url(session, limiter, url, headers):
+    """
+    检查单个地址是否可访问：HEAD 返回 200 即为可用；HEAD 被拒绝时用 GET Range 再试，
+    返回 200 或 206 即为可用。
+    """
+    await limiter.wait()
+    started = time.monotonic()
+    async with session.head(url, headers=headers, allow_redirects=True) as response:
+        latency = time.monotonic() - started
+        if response.status == 200:
+            return ProbeResult(True, latency)
+        if response.status not in HEAD_FALLBACK_STATUSES:
+            return ProbeResult(False, latency, reason=f"HEAD {response.status}")
+
+    await limiter.wait()
+    range_headers = dict(headers, Range="bytes=0-0")
+    async with session.get(url, headers=range_headers, allow_redirects=True) as response:
+        if response.status in (200, 206):
+            return ProbeResult(True, latency)
+        return ProbeResult(False, latency, reason=f"GET {response.status}")
+
+
+async def _read_prefix(response, limit):
+    """最多读取响应正文的前 limit 字节。"""
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(HLS_SEGMENT_PROBE_BYTES):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return b"".join(chunks)[:limit]
+
+
+def _is_hls_playlist(data):
+    """正文（忽略开头的 BOM 和空白）是否以 #EXTM3U 开头。"""
+    return data[:64].decode("utf-8", errors="replace").lstrip("\ufeff \t\r\n").startswith("#EXTM3U")
+
+
+def _looks_like_media(data, content_type):
+    """
+    根据文件头或 Content-Type 判断响应是否为媒体数据：
+    MPEG-TS 同步字节 0x47（每 188 字节一个包）、FLV、ID3（AAC / MP3）、MP4 的 ftyp，
+    或 Content-Type 为 video/*、application/octet-stream。正文为空时总是返回 False。
+    """
+    if not data:
+        return False
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type.startswith("video/") or media_type == "application/octet-stream":
+        return True
+    if data[0] == 0x47 and (len(data) <= 188 or data[188] == 0x47):
+        return True
+    return data.startswith((b"FLV", b"ID3")) or data[4:8] == b"ftyp"
+
+
+def _parse_hls_playlist(text):
+    """
+    解析 HLS 清单，返回 (是否为主清单, 第一个变体或分片的 URI)。
+    没有任何变体或分片时 URI 为 None。
+    """
+    is_master = False
+    expect_variant = False
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF"):
+            is_master = True
+            expect_variant = True
+        elif line.startswith("#"):
+            continue
+        elif expect_variant or not is_master:
+            return is_master, line
+    return is_master, None
+
+
+async def probe_hls(session, limiter, url, headers, segment_bytes=HLS_SEGMENT_PROBE_BYTES):
+    """
+    HLS 深度探测：
+    1. 下载清单，必须返回 200 且以 #EXTM3U 开头；
+    2. 若为主清单，取第一个变体清单继续下载（主清单最多嵌套两层）；
+    3. 媒体清单中必须至少有一个分片，读取第一个分片的前 segment_bytes 字节。
+    非 HLS 地址（正文不以 #EXTM3U 开头）只读取正文的前 segment_bytes 字节，
+    有媒体文件头（见 _looks_like_media）或 Content-Type 为 video/*、application/octet-stream 时视为可用，
+    HTML、JSON 或纯文本的错误页面视为失败。
+
+    返回 ProbeResult，latency 为清单请求的响应延迟，throughput 为读取媒体数据的吞吐量。
+    """
+    latency = None
+    playlist_url = url
+    for depth in range(3):
+        await limiter.wait()
+        started = time.monotonic()
+        async with session.get(playlist_url, headers=headers, allow_redirects=True) as response:
+            if latency is None:
+                latency = time.monotonic() - started
+            if response.status != 200:
+                return ProbeResult(False, latency, reason=f"playlist {response.status}")
+            body_started = time.monotonic()
+            # 先只读一块判断格式；是清单时再读取剩余部分
+            body = await _read_prefix(response, segment_bytes)
+            is_playlist = _is_hls_playlist(body)
+            if is_playlist and len(body) >= segment_bytes:
+                body += await _read_prefix(response, HLS_MANIFEST_MAX_BYTES - len(body))
+            content_type = response.headers.get("Content-Type", "")
+            base_url = str(response.url)
+
+        if not is_playlist:
+            if depth == 0 and _looks_like_media(body, content_type):
+                # 不是 HLS，而是直接的媒体流（如 .ts / .flv），以读取到的数据计算吞吐量
+                elapsed = max(time.monotonic() - body_started, 1e-6)
+                return ProbeResult(True, latency, len(body) / elapsed)
+            return ProbeResult(False, latency, reason="not an HLS playlist or media stream")
+
+        text = body.decode("utf-8", errors="replace")
+        is_master, uri = _parse_hls_playlist(text)
+        if uri is None:
+            return ProbeResult(False, latency, reason="empty playlist")
+        if not is_master:
+            return await _probe_segment(session, limiter, urljoin(base_url, uri), headers, latency, segment_bytes)
+        playlist_url = urljoin(base_url, uri)
+
+    return ProbeResult(False, latency, reason="too many nested playlists")
+
+
+async def _probe_segment(session, limiter, segment_url, headers, latency, segment_bytes):
+    """读取媒体分片的前 segment_bytes 字节并计算吞吐量。"""
+    await limiter.wait()
+    range_headers = dict(headers, Range=f"bytes=0-{segment_bytes - 1}")
+    started = time.monotonic()
+    async with session.get(segment_url, headers=range_headers, allow_redirects=True) as response:
+        if response.status not in (200, 206):
+            return ProbeResult(False, latency, reason=f"segment {response.status}")
+        data = await _read_prefix(response, segment_bytes)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    if not data:
+        return ProbeResult(False, latency, reason="empty segment")
+    return ProbeResult(True, latency, len(data) / elapsed)
+
+
+async def _probe_one(session, limiter, probe, url, headers, timeout):
+    """
+    在 timeout 秒内用 probe 探测一个地址，check_urls_async 和 BackgroundProber 共用。
+    超时、连接错误和其他意外异常都转换为不可用的 ProbeResult，不会向调用方抛出。
+    """
+    try:
+        return await asyncio.wait_for(probe(session, limiter, url, headers), timeout)
+    except asyncio.TimeoutError:
+        return ProbeResult(False, reason="timeout")
+    except (aiohttp.ClientError, ValueError) as e:
+        # 连接错误或非法地址都认为不可访问
+        return ProbeResult(False, reason=type(e).__name__)
+    except Exception as e:
+        # 解析响应等环节的意外错误同样只影响这一个地址
+        return ProbeResult(False, reason=f"{type(e).__name__}: {e}")
+
+
+async def check_urls_async(channels, max_concurrency=100, per_host_limit=4, rate_limit=50, timeout=15, mode="head"):
+    """
+    并发检查频道地址的可用性。
+
+    Args:
+        channels (list): 频道元组列表，url 在最后，headers 在倒数第 2 个位置。
+        max_concurrency (int): 全局最大并发请求数（同时也是连接池大小）。
+        per_host_limit (int): 同一主机的最大并发连接数。
+        rate_limit (float): 每秒最多发出的请求数，None 表示不限制。
+        timeout (float): 单个地址的总超时（秒），包含 GET Range 回退或 HLS 的多次请求。
+        mode (str): "head" 为快速 HEAD 检查；"hls" 为 HLS 深度探测（清单 + 变体 + 分片开头）。
+
+    Returns:
+        list[ProbeResult]: 与 channels 一一对应的检查结果。
+    """
+    probe = probe_hls if mode == "hls" else probe_url
+    results = [None] * len(channels)
+    pending = asyncio.Queue()
+    for item in interleave_by_host(
+        (index, channel[-1], build_request_headers(channel[-2])) for index, channel in enumerate(channels)
+    ):
+        pending.put_nowait(item)
+
+    limiter = RateLimiter(rate_limit)
+    connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=per_host_limit, ttl_dns_cache=600)
+    progress = tqdm(total=len(channels), desc="Checking URLs")
+
+    async def worker(session):
+        while True:
+            try:
+                index, url, headers = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results[index] = await _probe_one(session, limiter, probe, url, headers, timeout)
+            progress.update(1)
+
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(worker(session) for _ in range(min(max_concurrency, len(channels)) or 1)))
+    finally:
+        progress.close()
+    return results
+
+
+def check_urls(channels, max_concurrency=100, per_host_limit=4, rate_limit=50, timeout=15, mode="head"):
+    """check_urls_async 的同步入口，返回与 channels 一一对应的 ProbeResult 列表。"""
+    if not channels:
+        return []
+    return asyncio.run(check_urls_async(channels, max_concurrency, per_host_limit, rate_limit, timeout, mode))
+
+
+class BackgroundProber:
+    """
+    在后台线程中运行事件循环和共享的连接池，submit 提交的地址立即开始探测，返回 concurrent.futures.Future。
+
+    与 check_urls 的限制相同：全局并发数、同一主机的并发数（先占用主机名额再占用全局名额，
+    避免同一主机的请求占满全局并发）和每秒请求数。用法：
+
+        with BackgroundProber(100, 4, 50, 15, "head") as prober:
+            future = prober.submit(channel)
+            result = future.result()   # ProbeResult
+    """
+
+    def __init__(self, max_concurrency=100, per_host_limit=4, rate_limit=50, timeout=15, mode="head"):
+        self._probe = probe_hls if mode == "hls" else probe_url
+        self._timeout = timeout
+        self._per_host_limit = per_host_limit
+        self._host_semaphores = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="url-prober", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(max_concurrency, per_host_limit, rate_limit), self._loop).result()
+
+    async def _setup(self, max_concurrency, per_host_limit, rate_limit):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._limiter = RateLimiter(rate_limit)
+        connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=per_host_limit, ttl_dns_cache=600)
+        self._session = aiohttp.ClientSession(connector=connector)
+
+    async def _run(self, url, headers):
+        host = urlsplit(url).hostname or ""
+        host_semaphore = self._host_semaphores.get(host)
+        if host_semaphore is None:
+            host_semaphore = self._host_semaphores[host] = asyncio.Semaphore(self._per_host_limit)
+        async with host_semaphore, self._semaphore:
+            return await _probe_one(self._session, self._limiter, self._probe, url, headers, self._timeout)
+
+    async def _shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._session.close()
+
+    def submit(self, channel):
+        """提交一个频道（url 在最后，headers 在倒数第 2 个位置）的探测。"""
+        return asyncio.run_coroutine_threadsafe(
+            self._run(channel[-1], build_request_headers(channel[-2])), self._loop
+        )
+
+    def close(self):
+        """关闭连接池并停止后台线程；未完成的探测会被取消。"""
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,96 @@
+# utils/stream_rank.py
+"""
+同一正式频道多个流地址的质量排序。
+
+每个候选流按以下几项打分（分数越高越靠前）：
+- 原始标题中的分辨率提示（4K > 1080p > 720p > 无标注 > SD）；
+- 健康历史中记录的响应延迟，越低越好；上次检查不可用的地址大幅降分；
+- 所在主机的历史成功率；
+- HTTPS 地址略微加分。
+排序后每个频道只保留得分最高的若干个流，同分时保持源中出现的顺序。
+"""
+import re
+from urllib.parse import urlsplit
+
+# 分辨率提示及对应分数，按顺序匹配第一个命中的规则；没有任何标注时记 RESOLUTION_UNKNOWN_SCORE
+RESOLUTION_SCORES = [
+    (re.compile(r'(?i)(?:2160p|\b4k\b|\buhd\b)'), 40),
+    (re.compile(r'(?i)(?:1080[pi]|\bfhd\b|\bfull\s*hd\b)'), 30),
+    (re.compile(r'(?i)(?:720p|\bhd\b)'), 20),
+    (re.compile(r'(?i)(?:576[pi]|480[pi]|360p|\bsd\b)'), 10),
+]
+RESOLUTION_UNKNOWN_SCORE = 15
+
+# 延迟得分：LATENCY_SCORE 分按延迟线性递减，达到 LATENCY_CEILING 秒时为 0
+LATENCY_SCORE = 20
+LATENCY_CEILING = 2.0
+
+# 主机成功率得分（成功率 * HOST_SCORE），没有历史记录的主机按一半计
+HOST_SCORE = 20
+
+HTTPS_SCORE = 5
+
+# 健康历史中上次检查不可用的地址的扣分
+DEAD_PENALTY = 100
+
+
+def resolution_score(title):
+    """根据原始标题中的分辨率提示打分。"""
+    for pattern, score in RESOLUTION_SCORES:
+        if pattern.search(title):
+            return score
+    return RESOLUTION_UNKNOWN_SCORE
+
+
+def build_stream_scorer(stream_health=None, host_reliability=None):
+    """
+    构建打分函数 score(original_title, url) -> float。
+
+    Args:
+        stream_health (Mapping): url -> (上次是否可用, 延迟)，来自 HealthStore.load_stream_health；
+            打分时才查询，之后对它的更新（例如流水线中陆续完成的检查）同样生效。
+        host_reliability (dict): host -> 历史成功率，来自 HealthStore.load_host_reliability。
+    """
+    stream_health = stream_health if stream_health is not None else {}
+    host_reliability = host_reliability or {}
+
+    def score(title, url):
+        value = resolution_score(title)
+        health = stream_health.get(url)
+        if health is not None:
+            ok, latency = health
+            if not ok:
+                value -= DEAD_PENALTY
+            elif latency is not None:
+                value += LATENCY_SCORE * max(0.0, 1.0 - latency / LATENCY_CEILING)
+        parts = urlsplit(url)
+        value += HOST_SCORE * host_reliability.get(parts.hostname or "", 0.5)
+        if parts.scheme == "https":
+            value += HTTPS_SCORE
+        return value
+
+    return score
+
+
+def select_top_streams(channels, scores, max_per_channel=None):
+    """
+    按频道名（title，不区分大小写）分组，组内按得分从高到低排序，每组最多保留 max_per_channel 个。
+
+    Args:
+        channels (list): Channel 记录列表。
+        scores (list): 与 channels 一一对应的得分。
+        max_per_channel (int): 每个频道保留的流数量上限，None 表示只排序不截断。
+
+    Returns:
+        list: 排序、截断后的 Channel 列表；各频道按首次出现的顺序排列。
+    """
+    groups = {}
+    for channel, score in zip(channels, scores):
+        groups.setdefault(channel.title.lower(), []).append((score, channel))
+
+    selected = []
+    for candidates in groups.values():
+        # sorted 是稳定排序，同分时保持源中出现的顺序
+        candidates = sorted(candidates, key=lambda item: -item[0])
+        selected.extend(channel for _, channel in candidates[:max_per_channel])
+    return selected
@@ -0,0 +1,55 @@
+# utils/url_canonical.py
+"""
+流地址规范化：把指向同一个流的不同写法（http/https、主机名大小写、默认端口、查询参数顺序、
+跟踪参数、结尾斜杠）归一为同一个键，用于去重。rtmp、rtsp 等其他协议的协议名保留在键中。
+"""
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# 规范化时丢弃的跟踪参数（小写）；以 utm_ 开头的参数也会被丢弃
+TRACKING_PARAMS = frozenset({'fbclid', 'gclid', 'yclid', 'msclkid', 'mc_cid', 'mc_eid', 'spm'})
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443, 'rtsp': 554, 'rtmp': 1935}
+
+# 视为同一个流的协议：键中不包含协议名
+_WEB_SCHEMES = frozenset({'http', 'https'})
+
+URL_KEY_CACHE_SIZE = 200_000
+
+
+@lru_cache(maxsize=URL_KEY_CACHE_SIZE)
+def canonical_url_key(url):
+    """
+    返回 url 的规范化键：
+    - http 与 https 视为同一个流，其他协议（rtmp、rtsp 等）保留协议名；忽略 #fragment；
+    - 主机名转小写，去掉默认端口；
+    - 去掉路径结尾的斜杠；
+    - 删除跟踪参数，其余查询参数按名称和值排序。
+    无法解析的地址原样返回。
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.hostname:
+        return url
+
+    host = f"[{parts.hostname}]" if ':' in parts.hostname else parts.hostname
+    if port is not None and port != _DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{port}"
+    if parts.username or parts.password:
+        host = f"{parts.username or ''}:{parts.password or ''}@{host}"
+
+    query = ''
+    if parts.query:
+        params = [
+            (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if name.lower() not in TRACKING_PARAMS and not name.lower().startswith('utm_')
+        ]
+        query = urlencode(sorted(params))
+
+    scheme = parts.scheme.lower()
+    prefix = '' if scheme in _WEB_SCHEMES else f"{scheme}://"
+    key = f"{prefix}{host}{parts.path.rstrip('/')}"
+    return f"{key}?{query}" if query else key
@@ -0,0 +1,169 @@
+# utils/xmltv.py
+"""
+流式 XMLTV 写入器。
+
+频道和节目在产生时直接写入文件，不在内存中构建整棵 ElementTree。
+indent 不为 None 时的输出与 minidom.toprettyxml(indent=indent, encoding=encoding) 逐字节一致
+（属性顺序、转义规则、只含文本的元素写在一行）。
+
+TeeFile 可以把同一份输出同时写入多个文件（例如原始 XML 和 gzip 压缩流），
+XMLTVWriterGroup 则把频道和节目同时交给多个写入器（例如缩进版本和紧凑版本）。
+
+另外提供 XMLTV 时间戳（如 "20240101123000 +0800"）的快速解析。
+"""
+import io
+import calendar
+
+
+def parse_xmltv_time(value):
+    """
+    把 XMLTV 时间戳解析为 Unix 时间（秒）。
+
+    格式为 YYYYmmddHHMM[SS] 加可选的时区偏移（±HHMM），秒可以省略，没有偏移时按 UTC 处理；
+    按固定位置切片解析，不使用 strptime。无法解析时返回 None。
+    """
+    try:
+        seconds_text = value[12:14]
+        if len(seconds_text) == 2 and seconds_text.isdigit():
+            seconds, offset = int(seconds_text), value[14:]
+        else:
+            seconds, offset = 0, value[12:]
+        timestamp = calendar.timegm((
+            int(value[0:4]), int(value[4:6]), int(value[6:8]),
+            int(value[8:10]), int(value[10:12]), seconds,
+        ))
+        offset = offset.strip()
+        if offset:
+            seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+            if offset[0] == "+":
+                timestamp -= seconds
+            elif offset[0] == "-":
+                timestamp += seconds
+            else:
+                return None
+    except (ValueError, TypeError, IndexError):
+        return None
+    return timestamp
+
+
+def escape_xml(value):
+    """与 minidom 相同的转义规则，同时用于文本和属性值。"""
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _format_attrs(attrs):
+    return "".join(f' {name}="{escape_xml(value)}"' for name, value in attrs.items())
+
+
+class XMLTVWriter:
+    """
+    逐条写入 <channel> 和 <programme> 的 XMLTV 写入器。
+
+    用法：
+        with XMLTVWriter(f, {'date': '20240101'}) as writer:
+            writer.write_channel(channel_id, display_name)
+            writer.write_programme(channel_id, start, stop, title)
+
+    Args:
+        fileobj: 以二进制方式打开的可写文件对象，写入器不会关闭它。
+        root_attrs (dict): <tv> 根节点的属性。
+        indent (str): 每层缩进；None 表示不缩进、不换行的紧凑输出。
+        encoding (str): 输出编码，无法编码的字符写为字符引用。
+    """
+
+    def __init__(self, fileobj, root_attrs=None, indent="  ", encoding="utf-8"):
+        self._out = io.TextIOWrapper(fileobj, encoding=encoding, errors="xmlcharrefreplace", newline="\n")
+        self._root_attrs = dict(root_attrs or {})
+        self._encoding = encoding
+        self._indent = indent or ""
+        self._newl = "\n" if indent is not None else ""
+        self._started = False
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._out.detach()
+
+    def _start(self):
+        """写入 XML 声明和 <tv> 开始标签。"""
+        self._out.write(f'<?xml version="1.0" encoding="{self._encoding}"?>{self._newl}')
+        self._out.write(f'<tv{_format_attrs(self._root_attrs)}>{self._newl}')
+        self._started = True
+
+    def _write_element(self, tag, attrs, children):
+        """写入一个二级元素，children 为 (tag, attrs, text) 列表。"""
+        if not self._started:
+            self._start()
+        indent, newl = self._indent, self._newl
+        if not children:
+            self._out.write(f'{indent}<{tag}{_format_attrs(attrs)}/>{newl}')
+            return
+        parts = [f'{indent}<{tag}{_format_attrs(attrs)}>{newl}']
+        for child_tag, child_attrs, text in children:
+            parts.append(f'{indent}{indent}<{child_tag}{_format_attrs(child_attrs)}>{escape_xml(text)}</{child_tag}>{newl}')
+        parts.append(f'{indent}</{tag}>{newl}')
+        self._out.write("".join(parts))
+
+    def write_channel(self, channel_id, display_name):
+        self._write_element("channel", {"id": channel_id}, [("display-name", {}, display_name)])
+
+    def write_programme(self, channel, start, stop, title=None, lang="eng"):
+        """写入一个节目，title 为空时不写 <title> 子节点。"""
+        children = [("title", {"lang": lang}, title)] if title else []
+        self._write_element("programme", {"channel": channel, "start": start, "stop": stop}, children)
+
+    def close(self):
+        """写入结束标签并刷新缓冲区。"""
+        if self._closed:
+            return
+        if self._started:
+            self._out.write(f'</tv>{self._newl}')
+        else:
+            self._out.write(f'<?xml version="1.0" encoding="{self._encoding}"?>{self._newl}')
+            self._out.write(f'<tv{_format_attrs(self._root_attrs)}/>{self._newl}')
+        self._out.flush()
+        self._out.detach()
+        self._closed = True
+
+
+class TeeFile(io.RawIOBase):
+    """把写入的字节原样写入多个二进制文件对象（不负责关闭它们）。"""
+
+    def __init__(self, *fileobjs):
+        super().__init__()
+        self._fileobjs = fileobjs
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        for fileobj in self._fileobjs:
+            fileobj.write(data)
+        return len(data)
+
+
+class XMLTVWriterGroup:
+    """把 write_channel / write_programme 同时转发给多个 XMLTVWriter。"""
+
+    def __init__(self, writers):
+        self._writers = list(writers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for writer in self._writers:
+            writer.__exit__(exc_type, exc, tb)
+
+    def write_channel(self, channel_id, display_name):
+        for writer in self._writers:
+            writer.write_channel(channel_id, display_name)
+
+    def write_programme(self, channel, start, stop, title=None, lang="eng"):
+        for writer in self._writers:
+            writer.write_programme(channel, start, stop, title, lang)